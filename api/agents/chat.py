@@ -0,0 +1,324 @@
+"""
+Chat Helpers - The light path behind /api/chat
+Tool selection, Hugging Face Gemma calls and memory load/save, kept apart
+from the LangGraph supervisor so the endpoint doesn't import langgraph or
+langchain_core
+"""
+
+from typing import List, Dict, Any, Optional, AsyncIterator
+import os
+import asyncio
+import functools
+import re
+import importlib
+import httpx
+import orjson
+from types import MappingProxyType
+
+# Resolve the services package once: relative when loaded as api.agents,
+# top-level when api/ itself is on sys.path (local dev / Vercel entrypoint)
+_SERVICES = (
+    f"{__package__.rpartition('.')[0]}.services"
+    if __package__ and "." in __package__
+    else "services"
+)
+
+# Import memory system
+try:
+    _memory = importlib.import_module(f"{_SERVICES}.memory")
+    get_manager = _memory.get_manager
+    format_memory_context = _memory.format_memory_context
+    MEMORY_AVAILABLE = True
+except ImportError:
+    MEMORY_AVAILABLE = False
+    print("Warning: Memory system not available")
+
+# Import semantic response cache
+try:
+    SemanticCache = importlib.import_module(f"{_SERVICES}.cache").SemanticCache
+    # Both replay stored answers verbatim, so both keep the default
+    # near-identical match threshold; /api/chat gets its own entries
+    semantic_cache = SemanticCache(ttl=3600)
+    chat_cache = SemanticCache(ttl=3600)
+    CACHE_AVAILABLE = True
+except ImportError:
+    semantic_cache = None
+    chat_cache = None
+    CACHE_AVAILABLE = False
+
+
+# Shared read-only default for nodes reading a missing profile
+_EMPTY_PROFILE = MappingProxyType({})
+
+
+# Hugging Face Inference API for Gemma-3-27b-it (FREE!)
+HUGGINGFACE_API_URL = "https://router.huggingface.co/novita/v3/openai/chat/completions"
+HUGGINGFACE_MODEL = "google/gemma-3-27b-it"
+# Read once; the token doesn't change within a process
+HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
+
+# Long-lived pooled client so repeat calls reuse the warm TLS connection
+_HF_LIMITS = httpx.Limits(
+    max_keepalive_connections=int(os.getenv("HF_KEEPALIVE", "20")),
+    max_connections=int(os.getenv("HF_MAX_CONNS", "100")),
+    keepalive_expiry=30.0,
+)
+# An async client's connections belong to the event loop that opened them,
+# so it is rebuilt when called from a different loop
+_hf_async_client: Optional[httpx.AsyncClient] = None
+_hf_async_loop = None
+
+
+def _get_hf_async_client() -> httpx.AsyncClient:
+    """Get the pooled async Hugging Face client for the running event loop."""
+    global _hf_async_client, _hf_async_loop
+    loop = asyncio.get_running_loop()
+    if _hf_async_client is None or _hf_async_loop is not loop:
+        _hf_async_loop = loop
+        _hf_async_client = httpx.AsyncClient(timeout=120.0, limits=_HF_LIMITS, http2=True)
+    return _hf_async_client
+
+
+async def warmup_http_clients(timeout: float = 5.0):
+    """
+    Open a pooled connection to the Hugging Face router ahead of the first
+    request, so it doesn't pay the TCP+TLS handshake. Errors are ignored.
+    """
+    try:
+        await _get_hf_async_client().head(HUGGINGFACE_API_URL, timeout=timeout)
+    except Exception as e:
+        print(f"HTTP warmup skipped: {e}")
+
+
+async def close_http_clients():
+    """Close the pooled Hugging Face client (call on app shutdown)."""
+    global _hf_async_client
+    if _hf_async_client is not None and _hf_async_loop is asyncio.get_running_loop():
+        await _hf_async_client.aclose()
+    _hf_async_client = None
+
+async def call_huggingface_llm(messages: List[Dict[str, str]], max_tokens: int = 2048) -> str:
+    """
+    Call Hugging Face Inference API with Gemma-3-27b-it model.
+    This is 100% FREE with a Hugging Face account!
+    
+    Args:
+        messages: List of message dicts with 'role' and 'content'
+        max_tokens: Maximum tokens to generate
+        
+    Returns:
+        Generated text response
+    """
+    hf_token = HUGGINGFACE_API_KEY
+    
+    if not hf_token:
+        raise ValueError("HUGGINGFACE_API_KEY or HF_TOKEN environment variable not set")
+    
+    headers = {
+        "Authorization": f"Bearer {hf_token}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "model": HUGGINGFACE_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": False
+    }
+    
+    # Pre-serialize with orjson instead of httpx's stdlib json encoder
+    response = await _get_hf_async_client().post(
+        HUGGINGFACE_API_URL,
+        headers=headers,
+        content=orjson.dumps(payload)
+    )
+    
+    if response.status_code != 200:
+        error_text = response.text
+        raise Exception(f"Hugging Face API error {response.status_code}: {error_text}")
+    
+    result = orjson.loads(response.content)
+    return result["choices"][0]["message"]["content"]
+
+
+async def stream_huggingface_llm(messages: List[Dict[str, str]], max_tokens: int = 2048) -> AsyncIterator[str]:
+    """
+    Streaming version of call_huggingface_llm.
+    Yields text deltas from the OpenAI-compatible event stream as Gemma
+    generates them, so callers can forward output before the answer is done.
+    """
+    hf_token = HUGGINGFACE_API_KEY
+    
+    if not hf_token:
+        raise ValueError("HUGGINGFACE_API_KEY or HF_TOKEN environment variable not set")
+    
+    headers = {
+        "Authorization": f"Bearer {hf_token}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "model": HUGGINGFACE_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": True
+    }
+    
+    async with _get_hf_async_client().stream(
+        "POST",
+        HUGGINGFACE_API_URL,
+        headers=headers,
+        content=orjson.dumps(payload)
+    ) as response:
+        if response.status_code != 200:
+            error_text = (await response.aread()).decode("utf-8", errors="replace")
+            raise Exception(f"Hugging Face API error {response.status_code}: {error_text}")
+        
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = orjson.loads(data).get("choices")
+            if not choices:
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+def _phrase_regex(phrases: List[str]) -> "re.Pattern":
+    """Compile phrases into one alternation with plain substring semantics."""
+    return re.compile("|".join(re.escape(p) for p in phrases))
+
+
+# Routing decisions are memoized for messages up to this length
+_ROUTE_CACHE_MAX_CHARS = 200
+
+# Tool routing table, most specific first
+_TOOL_PATTERNS = [
+    # Diagram patterns (check first - more specific)
+    ("diagram", _phrase_regex([
+        "diagram", "flowchart", "flow chart", "block diagram",
+        "process diagram", "svg", "chart", "hierarchy",
+        "org chart", "organization chart", "tree diagram",
+        "sequence diagram", "architecture diagram", "system diagram",
+        "create a diagram", "draw a diagram", "make a flowchart",
+        "visualize the process", "show the flow", "workflow diagram"
+    ])),
+    # Image generation patterns
+    ("image", _phrase_regex([
+        "generate image", "create image", "draw a picture", "make an image",
+        "generate a picture", "create a picture", "illustrate",
+        "generate art", "create art", "make art", "artwork",
+        "image of", "picture of", "photo of", "painting of",
+        "render", "design an image", "generate visual",
+        "stable diffusion", "ai image", "ai art", "realistic image"
+    ])),
+    # Report patterns
+    ("report", _phrase_regex([
+        "report", "document", "detailed analysis", "comprehensive",
+        "write about", "research paper", "essay", "thesis",
+        "summarize in detail", "full explanation", "in-depth",
+        "generate a report", "create a document", "write a paper"
+    ])),
+    # Presentation patterns
+    ("presentation", _phrase_regex([
+        "presentation", "ppt", "powerpoint", "slides", "slide deck",
+        "create slides", "make a presentation", "design slides",
+        "keynote", "pitch deck", "slideshow"
+    ])),
+]
+
+
+def auto_select_tool(message: str) -> str:
+    """
+    Auto-select the best tool based on user message.
+    Uses pattern matching (NO LLM call) for instant routing.
+    """
+    message_lower = message.lower()
+    # Only short messages are cached, which keeps the cache's memory bounded
+    if len(message_lower) <= _ROUTE_CACHE_MAX_CHARS:
+        return _cached_select_tool(message_lower)
+    return _select_tool(message_lower)
+
+
+def _select_tool(message_lower: str) -> str:
+    for tool, pattern in _TOOL_PATTERNS:
+        if pattern.search(message_lower):
+            return tool
+    
+    # Default to chat
+    return "chat"
+
+
+_cached_select_tool = functools.lru_cache(maxsize=4096)(_select_tool)
+
+
+async def load_memory_context(user_id: str, session_id: str, query: str) -> Dict[str, Any]:
+    """Load memory context for a user query."""
+    try:
+        manager = get_manager(user_id, session_id)
+        context = await manager.build_context_for_query(query)
+        # Format the context we already have instead of rebuilding it
+        memory_str = format_memory_context(context)
+        
+        return {
+            "memory_context": memory_str,
+            "user_profile": context.get("user_profile", {}),
+            "effective_strategies": context.get("effective_strategies", []),
+            "current_topic": context.get("current_topic"),
+        }
+    except Exception as e:
+        print(f"Error loading memory context: {e}")
+        return {
+            "memory_context": "",
+            "user_profile": {},
+            "effective_strategies": [],
+            "current_topic": None,
+        }
+
+
+async def save_interaction_memory(
+    user_id: str,
+    session_id: str,
+    user_message: str,
+    assistant_response: str,
+    topic: Optional[str] = None,
+    was_helpful: Optional[bool] = None,
+    extracted_facts: Optional[List[Dict[str, str]]] = None
+):
+    """Save interaction to memory system."""
+    try:
+        manager = get_manager(user_id, session_id)
+        await manager.process_interaction(
+            user_message=user_message,
+            assistant_response=assistant_response,
+            topic=topic,
+            was_helpful=was_helpful,
+            extracted_facts=extracted_facts
+        )
+    except Exception as e:
+        print(f"Error saving memory: {e}")
+
+
+# Without a memory backend, swap in no-op versions once at import time
+# rather than checking MEMORY_AVAILABLE on every turn
+if not MEMORY_AVAILABLE:
+    _EMPTY_MEMORY = {
+        "memory_context": "",
+        "user_profile": _EMPTY_PROFILE,
+        "effective_strategies": (),
+        "current_topic": None,
+    }
+
+    async def load_memory_context(user_id: str, session_id: str, query: str) -> Dict[str, Any]:
+        """Memory system unavailable: return the shared empty context."""
+        return _EMPTY_MEMORY
+
+    async def save_interaction_memory(*args, **kwargs):
+        """Memory system unavailable: nothing to save."""
+        return None
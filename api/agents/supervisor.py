@@ -2,48 +2,33 @@
 LangGraph Supervisor Agent - The Brain of the AI Tutor
 Orchestrates multiple specialized agents based on user intent
 Enhanced with Agentic Memory System for context-aware tutoring
-Now supports Hugging Face Inference API with Gemma-3-27b-it (FREE!)
+The /api/chat helpers (Hugging Face Gemma calls, tool selection) live in agents.chat
 """
 
 from typing import TypedDict, Annotated, List, Dict, Any, Literal, Optional
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 import os
-import sys
-import json
 import asyncio
-import httpx
-
-# Add parent directory to path for local development
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Import memory system
-try:
-    try:
-        from ..services.memory import (
-            MemoryManager,
-            get_memory_context,
-            EpisodicMemory,
-            SemanticMemory,
-            ProceduralMemory,
-            WorkingMemory,
-            ImportanceLevel,
-        )
-    except ImportError:
-        from services.memory import (
-            MemoryManager,
-            get_memory_context,
-            EpisodicMemory,
-            SemanticMemory,
-            ProceduralMemory,
-            WorkingMemory,
-            ImportanceLevel,
-        )
-    MEMORY_AVAILABLE = True
-except ImportError:
-    MEMORY_AVAILABLE = False
-    print("Warning: Memory system not available")
+import functools
+import re
+import hashlib
+import orjson
+from .chat import (
+    _EMPTY_PROFILE,
+    _ROUTE_CACHE_MAX_CHARS,
+    _phrase_regex,
+    CACHE_AVAILABLE,
+    semantic_cache,
+    load_memory_context,
+)
+
+# Hidden fact markers the tutor appends to its responses
+_FACT_RE = re.compile(r'<!--FACT:(\w+):(.+?)-->', re.DOTALL)
+
+# Markdown-fenced JSON object, e.g. ```json {...} ```
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
 
 
 # Enhanced State Schema with memory context
@@ -70,115 +55,89 @@ class AgentState(TypedDict):
 
 
 # Initialize Gemini LLM
-def get_llm(model: str = None):
+def get_llm(model: str = None, temperature: float = 0.7, tier: str = "pro"):
     """
     Get the Gemini model instance.
     Default: gemini-2.5-pro (configurable via GEMINI_MODEL env var)
+    tier="flash" selects gemini-2.5-flash (GEMINI_FLASH_MODEL) for light
+    tasks that don't need deep reasoning, such as writing image prompts.
+    Instances are cached per (model, temperature), so the client, its
+    connection and credentials are reused across node invocations.
     
     Rate limits for free tier:
     - gemini-2.5-pro: 2 RPM, 50 RPD (requests per day)
     - gemini-2.0-flash: 15 RPM, 1500 RPD
     """
+    if model:
+        model_name = model
+    elif tier == "flash":
+        model_name = os.getenv("GEMINI_FLASH_MODEL", "gemini-2.5-flash")
+    else:
+        model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+    return _create_llm(model_name, temperature)
+
+
+@functools.lru_cache(maxsize=8)
+def _create_llm(model_name: str, temperature: float):
+    # Construction is synchronous, so concurrent coroutines can't race here
     from langchain_google_genai import ChatGoogleGenerativeAI
-    model_name = model or os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
     return ChatGoogleGenerativeAI(
         model=model_name,
         google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7,
-        convert_system_message_to_human=True,
+        temperature=temperature,
     )
 
 
-# Hugging Face Inference API for Gemma-3-27b-it (FREE!)
-HUGGINGFACE_API_URL = "https://router.huggingface.co/novita/v3/openai/chat/completions"
-HUGGINGFACE_MODEL = "google/gemma-3-27b-it"
-
-async def call_huggingface_llm(messages: List[Dict[str, str]], max_tokens: int = 2048) -> str:
+# Response schema for presentation_node (Gemini structured output)
+SLIDES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "slides": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "body": {"type": "string"},
+                    "imagePrompt": {"type": "string", "nullable": True},
+                },
+                "required": ["title", "body"],
+            },
+        },
+    },
+    "required": ["slides"],
+}
+
+
+@functools.lru_cache(maxsize=1)
+def get_presentation_llm():
     """
-    Call Hugging Face Inference API with Gemma-3-27b-it model.
-    This is 100% FREE with a Hugging Face account!
-    
-    Args:
-        messages: List of message dicts with 'role' and 'content'
-        max_tokens: Maximum tokens to generate
-        
-    Returns:
-        Generated text response
+    Get the Gemini instance used for slide generation.
+    Constrained to SLIDES_SCHEMA via JSON mode, so output is always parseable.
     """
-    hf_token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
-    
-    if not hf_token:
-        raise ValueError("HUGGINGFACE_API_KEY or HF_TOKEN environment variable not set")
-    
-    headers = {
-        "Authorization": f"Bearer {hf_token}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": HUGGINGFACE_MODEL,
-        "messages": messages,
-        "max_tokens": max_tokens,
-        "temperature": 0.7,
-        "stream": False
-    }
-    
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(
-            HUGGINGFACE_API_URL,
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code != 200:
-            error_text = response.text
-            raise Exception(f"Hugging Face API error {response.status_code}: {error_text}")
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro"),
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.7,
+        response_mime_type="application/json",
+        response_schema=SLIDES_SCHEMA,
+    )
 
 
-def call_huggingface_llm_sync(messages: List[Dict[str, str]], max_tokens: int = 2048) -> str:
-    """
-    Synchronous version of Hugging Face API call.
-    """
-    import httpx
-    
-    hf_token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
-    
-    if not hf_token:
-        raise ValueError("HUGGINGFACE_API_KEY or HF_TOKEN environment variable not set")
-    
-    headers = {
-        "Authorization": f"Bearer {hf_token}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": HUGGINGFACE_MODEL,
-        "messages": messages,
-        "max_tokens": max_tokens,
-        "temperature": 0.7,
-        "stream": False
-    }
-    
-    with httpx.Client(timeout=120.0) as client:
-        response = client.post(
-            HUGGINGFACE_API_URL,
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code != 200:
-            error_text = response.text
-            raise Exception(f"Hugging Face API error {response.status_code}: {error_text}")
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+# Exact-type dispatch for the common message shapes; anything else
+# (subclasses, other message types) takes the generic path below
+_ROLE_BY_TYPE = {
+    HumanMessage: "user",
+    AIMessage: "assistant",
+    SystemMessage: "system",
+}
 
 
 def get_message_content(msg) -> str:
     """Extract content from a message (handles both dict and LangChain message objects)"""
+    if type(msg) in _ROLE_BY_TYPE:
+        return msg.content
     if isinstance(msg, dict):
         return msg.get("content", "")
     elif hasattr(msg, "content"):
@@ -189,6 +148,9 @@ def get_message_content(msg) -> str:
 
 def get_message_role(msg) -> str:
     """Extract role from a message (handles both dict and LangChain message objects)"""
+    role = _ROLE_BY_TYPE.get(type(msg))
+    if role is not None:
+        return role
     if isinstance(msg, dict):
         return msg.get("role", "user")
     elif isinstance(msg, HumanMessage):
@@ -203,214 +165,210 @@ def get_message_role(msg) -> str:
         return "user"
 
 
-def auto_select_tool(message: str) -> str:
+def build_history(messages: List, limit: int) -> List:
     """
-    Auto-select the best tool based on user message.
-    Uses pattern matching (NO LLM call) for instant routing.
+    Convert the last `limit` messages into chat messages for the LLM.
+    State messages are already HumanMessage/AIMessage after add_messages,
+    so those are passed through as-is instead of being rebuilt.
     """
-    message_lower = message.lower()
-    
-    # Diagram patterns (check first - more specific)
-    diagram_patterns = [
-        "diagram", "flowchart", "flow chart", "block diagram",
-        "process diagram", "svg", "chart", "hierarchy",
-        "org chart", "organization chart", "tree diagram",
-        "sequence diagram", "architecture diagram", "system diagram",
-        "create a diagram", "draw a diagram", "make a flowchart",
-        "visualize the process", "show the flow", "workflow diagram"
-    ]
-    
-    # Image generation patterns
-    image_patterns = [
-        "generate image", "create image", "draw a picture", "make an image",
-        "generate a picture", "create a picture", "illustrate",
-        "generate art", "create art", "make art", "artwork",
-        "image of", "picture of", "photo of", "painting of",
-        "render", "design an image", "generate visual",
-        "stable diffusion", "ai image", "ai art", "realistic image"
-    ]
-    
-    # Report patterns
-    report_patterns = [
-        "report", "document", "detailed analysis", "comprehensive",
-        "write about", "research paper", "essay", "thesis",
-        "summarize in detail", "full explanation", "in-depth",
-        "generate a report", "create a document", "write a paper"
-    ]
-    
-    # Presentation patterns
-    presentation_patterns = [
-        "presentation", "ppt", "powerpoint", "slides", "slide deck",
-        "create slides", "make a presentation", "design slides",
-        "keynote", "pitch deck", "slideshow"
-    ]
-    
-    # Check for diagram (most specific first)
-    for pattern in diagram_patterns:
-        if pattern in message_lower:
-            return "diagram"
-    
-    # Check for image generation
-    for pattern in image_patterns:
-        if pattern in message_lower:
-            return "image"
-    
-    # Check for report
-    for pattern in report_patterns:
-        if pattern in message_lower:
-            return "report"
-    
-    # Check for presentation
-    for pattern in presentation_patterns:
-        if pattern in message_lower:
-            return "presentation"
-    
-    # Default to chat
-    return "chat"
-
-
-async def load_memory_context(user_id: str, session_id: str, query: str) -> Dict[str, Any]:
-    """Load memory context for a user query."""
-    if not MEMORY_AVAILABLE:
-        return {
-            "memory_context": "",
-            "user_profile": {},
-            "effective_strategies": [],
-            "current_topic": None,
-        }
-    
-    try:
-        manager = MemoryManager(user_id, session_id)
-        context = await manager.build_context_for_query(query)
-        memory_str = await get_memory_context(user_id, session_id, query)
-        
-        return {
-            "memory_context": memory_str,
-            "user_profile": context.get("user_profile", {}),
-            "effective_strategies": context.get("effective_strategies", []),
-            "current_topic": context.get("current_topic"),
-        }
-    except Exception as e:
-        print(f"Error loading memory context: {e}")
-        return {
-            "memory_context": "",
-            "user_profile": {},
-            "effective_strategies": [],
-            "current_topic": None,
-        }
+    history = []
+    # Slicing jumps straight to the tail: O(limit), not O(len(messages))
+    for msg in messages[-limit:]:
+        if type(msg) is HumanMessage or type(msg) is AIMessage:
+            history.append(msg)
+        elif get_message_role(msg) == "user":
+            history.append(HumanMessage(content=get_message_content(msg)))
+        else:
+            history.append(AIMessage(content=get_message_content(msg)))
+    return history
 
 
-async def save_interaction_memory(
-    user_id: str,
-    session_id: str,
-    user_message: str,
-    assistant_response: str,
-    topic: Optional[str] = None,
-    was_helpful: Optional[bool] = None,
-    extracted_facts: Optional[List[Dict[str, str]]] = None
-):
-    """Save interaction to memory system."""
-    if not MEMORY_AVAILABLE:
-        return
-    
-    try:
-        manager = MemoryManager(user_id, session_id)
-        await manager.process_interaction(
-            user_message=user_message,
-            assistant_response=assistant_response,
-            topic=topic,
-            was_helpful=was_helpful,
-            extracted_facts=extracted_facts
-        )
-    except Exception as e:
-        print(f"Error saving memory: {e}")
+# LLM calls currently running, keyed by client and prompt
+_inflight: Dict[str, asyncio.Future] = {}
 
 
-# Supervisor Node - Routes to appropriate agent
-def supervisor_node(state: AgentState) -> AgentState:
+def _inflight_key(llm, chat_messages: List) -> str:
+    digest = hashlib.blake2b(str(id(llm)).encode(), digest_size=16)
+    for message in chat_messages:
+        digest.update(b"\x00" + message.type.encode() + b"\x00" + str(message.content).encode())
+    return digest.hexdigest()
+
+
+async def generate_response(agent: str, llm, chat_messages: List, state: AgentState, stream: bool = True) -> str:
     """
-    The Supervisor analyzes user intent and routes to the appropriate agent.
-    Uses efficient pattern matching instead of LLM to save API quota.
+    Run an agent's LLM call behind the semantic response cache.
+    Only first-turn questions are cached, scoped per user, agent and language,
+    since later turns depend on the conversation so far.
+    With stream=True tokens are pulled via llm.astream, so astream_events
+    consumers of the graph receive them as they are generated; otherwise
+    it is a single llm.ainvoke. Concurrent identical prompts
+    are coalesced into one call; followers get the final text, not tokens.
     """
     messages = state["messages"]
-    last_message = get_message_content(messages[-1]) if messages else ""
-    last_message_lower = last_message.lower()
+    cacheable = CACHE_AVAILABLE and len(messages) == 1
+    
+    if cacheable:
+        prompt = get_message_content(messages[-1])
+        scope = f"{state.get('user_id', 'anonymous')}:{agent}:{state.get('language', 'en')}"
+        cached = await semantic_cache.alookup(prompt, scope=scope)
+        if cached is not None:
+            return cached
+    
+    # Identical prompts already in flight share the leader's call
+    key = _inflight_key(llm, chat_messages)
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    
+    future = asyncio.get_running_loop().create_future()
+    # Mark a failure as retrieved even when nobody else was waiting on it
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[key] = future
+    try:
+        if stream:
+            chunks = []
+            async for chunk in llm.astream(chat_messages):
+                chunks.append(chunk.content)
+            content = "".join(chunks)
+        else:
+            content = (await llm.ainvoke(chat_messages)).content
+        future.set_result(content)
+    except asyncio.CancelledError:
+        future.set_exception(RuntimeError("Coalesced LLM call was cancelled"))
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        del _inflight[key]
     
-    # Pattern-based routing to save LLM API calls
-    agent_name = "tutor"  # Default
+    if cacheable:
+        await semantic_cache.aupdate(prompt, content, scope=scope)
     
+    return content
+
+
+# Supervisor routing table, checked in order of specificity
+_ROUTE_PATTERNS = [
     # RAG patterns - questions about uploaded documents
-    rag_patterns = [
+    ("rag", _phrase_regex([
         "my document", "the document", "uploaded file", "uploaded document",
         "the textbook", "my textbook", "this pdf", "the pdf", "my file",
         "from the document", "in the document", "according to the document",
         "based on the document", "what does the document say", "the file says"
-    ]
-    
-    # Visual patterns - requests for images/diagrams
-    visual_patterns = [
-        "show me", "draw", "diagram", "image", "picture", "visualize",
-        "visual", "illustration", "chart", "graph", "sketch", "figure",
-        "can you show", "create an image", "make a diagram", "generate image"
-    ]
-    
+    ])),
     # Presentation patterns - slide creation
-    presentation_patterns = [
+    ("presentation", _phrase_regex([
         "presentation", "slides", "slide deck", "powerpoint", "ppt",
         "create slides", "make slides", "make a presentation",
         "create a presentation", "slideshow"
-    ]
-    
+    ])),
+    # Visual patterns - requests for images/diagrams
+    ("visual", _phrase_regex([
+        "show me", "draw", "diagram", "image", "picture", "visualize",
+        "visual", "illustration", "chart", "graph", "sketch", "figure",
+        "can you show", "create an image", "make a diagram", "generate image"
+    ])),
     # Feynman patterns - user wants to explain/teach
-    feynman_patterns = [
+    ("feynman", _phrase_regex([
         "let me explain", "i'll explain", "i will explain", "i want to explain",
         "let me teach", "i'll teach", "i understand it as", "my understanding is",
         "here's how i see it", "in my words", "can i explain", "test my understanding"
-    ]
-    
+    ])),
     # Advocate/debate patterns - critical thinking exercises
-    advocate_patterns = [
+    ("advocate", _phrase_regex([
         "debate", "argue", "devil's advocate", "counter argument", "play devil",
         "challenge my", "disagree with", "opposing view", "other side",
         "what's wrong with", "critique", "critical thinking"
-    ]
+    ])),
+]
+
+
+# Supervisor Node - Routes to appropriate agent
+def supervisor_node(state: AgentState) -> Dict[str, Any]:
+    """
+    The Supervisor analyzes user intent and routes to the appropriate agent.
+    Uses efficient pattern matching instead of LLM to save API quota.
+    """
+    messages = state["messages"]
+    last_message = get_message_content(messages[-1]) if messages else ""
+    last_message_lower = last_message.lower()
     
-    # Check patterns in order of specificity
-    for pattern in rag_patterns:
-        if pattern in last_message_lower:
-            agent_name = "rag"
-            break
+    # Pattern-based routing to save LLM API calls
+    if len(last_message_lower) <= _ROUTE_CACHE_MAX_CHARS:
+        agent_name = _cached_route_agent(last_message_lower)
+    else:
+        agent_name = _route_agent(last_message_lower)
     
-    if agent_name == "tutor":  # Only check if not already assigned
-        for pattern in presentation_patterns:
-            if pattern in last_message_lower:
-                agent_name = "presentation"
-                break
+    return {"next_step": agent_name}
+
+
+def _route_agent(message_lower: str) -> str:
+    for agent, pattern in _ROUTE_PATTERNS:
+        if pattern.search(message_lower):
+            return agent
+    return "tutor"  # Default
+
+
+_cached_route_agent = functools.lru_cache(maxsize=4096)(_route_agent)
+
+
+# Memory Node - Loads memory context in parallel with routing
+async def memory_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Loads the user's memory context.
+    Runs alongside the supervisor, so the memory round-trip no longer precedes
+    routing. Skipped when the caller has already supplied memory context.
+    """
+    if state.get("memory_context") is not None:
+        return {}
     
-    if agent_name == "tutor":
-        for pattern in visual_patterns:
-            if pattern in last_message_lower:
-                agent_name = "visual"
-                break
+    messages = state["messages"]
+    query = get_message_content(messages[-1]) if messages else ""
+    return await load_memory_context(state.get("user_id", "anonymous"), state.get("session_id", ""), query)
+
+
+# Invariant part of the tutor prompt; per-student context is appended after it
+_TUTOR_BASE_PROMPT = """You are an expert Socratic tutor aligned with SDG 4 (Quality Education).
+    Your role is to guide students to discover answers themselves, not just provide information.
+
+    TEACHING APPROACH:
+    1. When a student asks a question, first acknowledge their curiosity
+    2. Instead of giving the answer directly, ask guiding questions
+    3. Use analogies and real-world examples to make concepts relatable
+    4. Break complex topics into smaller, digestible pieces
+    5. Encourage critical thinking and reflection
+    6. Celebrate progress and correct misconceptions gently
     
-    if agent_name == "tutor":
-        for pattern in feynman_patterns:
-            if pattern in last_message_lower:
-                agent_name = "feynman"
-                break
+    FORMATTING:
+    - Use markdown for structure (headers, bullet points, code blocks)
+    - Keep paragraphs short and scannable
+    - Use emojis sparingly to make content engaging 📚
     
-    if agent_name == "tutor":
-        for pattern in advocate_patterns:
-            if pattern in last_message_lower:
-                agent_name = "advocate"
-                break
+    IMPORTANT: After your response, if you learn something new about this student's:
+    - Learning preferences (visual, auditory, hands-on)
+    - Subject strengths or weaknesses
+    - Interests or goals
+    Include it in a hidden section like: <!--FACT:category:fact-->
     
-    state["next_step"] = agent_name
-    return state
+    Remember: Your goal is to develop understanding, not just transmit information."""
 
 
 # Tutor Node - Main educational agent
-def tutor_node(state: AgentState) -> AgentState:
+@functools.lru_cache(maxsize=4096)
+def _tutor_prompt_head(language: str, personalization: str, strategy_hints: str, current_topic: str) -> str:
+    """Build the per-student part of the tutor prompt; repeat users hit the cache."""
+    return _TUTOR_BASE_PROMPT + f"""
+
+    PERSONALIZATION FOR THIS STUDENT:{personalization if personalization else " No specific profile data yet - adapt based on their responses."}
+    {strategy_hints}
+    
+    {f"CURRENT TOPIC CONTEXT: We've been discussing {current_topic}" if current_topic else ""}
+
+    LANGUAGE: Respond primarily in {language}. For technical terms, provide both the English term and a {language} explanation if different."""
+
+
+async def tutor_node(state: AgentState) -> Dict[str, Any]:
     """
     The core Socratic Tutor agent.
     Uses guided questioning to help students construct knowledge.
@@ -422,9 +380,9 @@ def tutor_node(state: AgentState) -> AgentState:
     language = state.get("language", "en")
     search_context = state.get("search_results", "")
     memory_context = state.get("memory_context", "")
-    user_profile = state.get("user_profile", {})
-    effective_strategies = state.get("effective_strategies", [])
-    current_topic = state.get("current_topic", "")
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
+    effective_strategies = state.get("effective_strategies") or ()
+    current_topic = state.get("current_topic") or ""
     
     # Build personalized teaching approach based on memory
     personalization = ""
@@ -438,79 +396,63 @@ def tutor_node(state: AgentState) -> AgentState:
     strategy_hints = ""
     if effective_strategies:
         strategies = [s["description"] for s in effective_strategies[:3]]
-        strategy_hints = f"\n\nPREVIOUSLY EFFECTIVE APPROACHES FOR THIS USER:\n{chr(10).join(strategies)}"
+        strategy_hints = "\n\nPREVIOUSLY EFFECTIVE APPROACHES FOR THIS USER:\n" + "\n".join(strategies)
     
-    system_prompt = f"""You are an expert Socratic tutor aligned with SDG 4 (Quality Education).
-    Your role is to guide students to discover answers themselves, not just provide information.
-
-    TEACHING APPROACH:
-    1. When a student asks a question, first acknowledge their curiosity
-    2. Instead of giving the answer directly, ask guiding questions
-    3. Use analogies and real-world examples to make concepts relatable
-    4. Break complex topics into smaller, digestible pieces
-    5. Encourage critical thinking and reflection
-    6. Celebrate progress and correct misconceptions gently
-
-    PERSONALIZATION FOR THIS STUDENT:{personalization if personalization else " No specific profile data yet - adapt based on their responses."}
-    {strategy_hints}
+    # Per-turn context changes every request, so it stays outside the cached head
+    system_prompt = _tutor_prompt_head(language, personalization, strategy_hints, current_topic) + f"""
     
     {memory_context if memory_context else ""}
     
-    {f"CURRENT TOPIC CONTEXT: We've been discussing {current_topic}" if current_topic else ""}
-
-    LANGUAGE: Respond primarily in {language}. For technical terms, provide both the English term and a {language} explanation if different.
-    
-    FORMATTING:
-    - Use markdown for structure (headers, bullet points, code blocks)
-    - Keep paragraphs short and scannable
-    - Use emojis sparingly to make content engaging 📚
-    
-    {f"RELEVANT CONTEXT FROM WEB SEARCH: {search_context}" if search_context else ""}
-    
-    IMPORTANT: After your response, if you learn something new about this student's:
-    - Learning preferences (visual, auditory, hands-on)
-    - Subject strengths or weaknesses
-    - Interests or goals
-    Include it in a hidden section like: <!--FACT:category:fact-->
-    
-    Remember: Your goal is to develop understanding, not just transmit information."""
+    {f"RELEVANT CONTEXT FROM WEB SEARCH: {search_context}" if search_context else ""}"""
     
     # Build message history for context
     chat_messages = [SystemMessage(content=system_prompt)]
-    for msg in messages[-10:]:  # Keep last 10 messages for context
-        if get_message_role(msg) == "user":
-            chat_messages.append(HumanMessage(content=get_message_content(msg)))
-        else:
-            chat_messages.append(AIMessage(content=get_message_content(msg)))
+    chat_messages.extend(build_history(messages, 10))  # Keep last 10 messages for context
     
-    response = llm.invoke(chat_messages)
+    response_content = await generate_response("tutor", llm, chat_messages, state)
     
-    # Extract any facts from the response
-    response_content = response.content
+    # Collect facts and strip their markers in a single pass; most replies
+    # carry no markers, and a plain substring check skips the regex then
     extracted_facts = []
-    import re
-    fact_matches = re.findall(r'<!--FACT:(\w+):(.+?)-->', response_content)
-    for category, fact in fact_matches:
-        extracted_facts.append({"category": category, "fact": fact})
-        # Remove fact markers from visible response
-        response_content = response_content.replace(f"<!--FACT:{category}:{fact}-->", "")
-    
-    # Add response to messages
-    state["messages"].append({
-        "role": "assistant",
-        "content": response_content.strip()
-    })
+    if "<!--FACT:" in response_content:
+        response_content = _FACT_RE.sub(
+            lambda m: extracted_facts.append({"category": m.group(1), "fact": m.group(2)}) or "",
+            response_content
+        )
+    
+    update = {
+        "messages": [{"role": "assistant", "content": response_content.strip()}],
+        "next_step": END,
+    }
     
     # Store extracted facts for memory system
     if extracted_facts:
-        state["extracted_facts"] = extracted_facts
+        update["extracted_facts"] = extracted_facts
+    
+    return update
+
+
+_RAG_PROMPT = """You are an educational assistant that answers questions based STRICTLY on provided document context.
+    
+    RULES:
+    1. Only answer based on the provided context
+    2. If the context doesn't contain relevant information, say so clearly
+    3. Quote relevant passages when appropriate
+    4. Cite page numbers or sections if available in metadata
+    5. Never make up information not in the context
+    
+    {personalization}
+    
+    {memory_context}
+    
+    DOCUMENT CONTEXT:
+    {rag_context}
     
-    state["next_step"] = END
-    return state
+    If context is empty, politely inform the user they need to upload a document to get grounded answers."""
 
 
 # RAG Node - Document-grounded responses
-def rag_node(state: AgentState) -> AgentState:
+async def rag_node(state: AgentState) -> Dict[str, Any]:
     """
     Retrieval-Augmented Generation agent.
     Grounds responses in uploaded documents to reduce hallucination.
@@ -521,7 +463,7 @@ def rag_node(state: AgentState) -> AgentState:
     messages = state["messages"]
     rag_context = state.get("rag_context", "")
     memory_context = state.get("memory_context", "")
-    user_profile = state.get("user_profile", {})
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
     
     # Personalization based on user profile
     explanation_style = ""
@@ -531,64 +473,24 @@ def rag_node(state: AgentState) -> AgentState:
         if user_profile.get("challenges"):
             explanation_style += f" Be extra clear when explaining topics related to: {', '.join(user_profile['challenges'][:2])}"
     
-    system_prompt = f"""You are an educational assistant that answers questions based STRICTLY on provided document context.
-    
-    RULES:
-    1. Only answer based on the provided context
-    2. If the context doesn't contain relevant information, say so clearly
-    3. Quote relevant passages when appropriate
-    4. Cite page numbers or sections if available in metadata
-    5. Never make up information not in the context
-    
-    {f"PERSONALIZATION: {explanation_style}" if explanation_style else ""}
-    
-    {memory_context if memory_context else ""}
-    
-    DOCUMENT CONTEXT:
-    {rag_context if rag_context else "No document has been uploaded. Please ask the user to upload a document first."}
-    
-    If context is empty, politely inform the user they need to upload a document to get grounded answers."""
+    system_prompt = _RAG_PROMPT.format(
+        personalization=f"PERSONALIZATION: {explanation_style}" if explanation_style else "",
+        memory_context=memory_context or "",
+        rag_context=rag_context or "No document has been uploaded. Please ask the user to upload a document first.",
+    )
     
     chat_messages = [SystemMessage(content=system_prompt)]
-    for msg in messages[-5:]:
-        if get_message_role(msg) == "user":
-            chat_messages.append(HumanMessage(content=get_message_content(msg)))
-        else:
-            chat_messages.append(AIMessage(content=get_message_content(msg)))
+    chat_messages.extend(build_history(messages, 5))
     
-    response = llm.invoke(chat_messages)
+    response_content = await generate_response("rag", llm, chat_messages, state)
     
-    state["messages"].append({
-        "role": "assistant", 
-        "content": response.content
-    })
-    state["next_step"] = END
-    return state
+    return {
+        "messages": [{"role": "assistant", "content": response_content}],
+        "next_step": END,
+    }
 
 
-# Visual Node - Image generation agent
-def visual_node(state: AgentState) -> AgentState:
-    """
-    Visual Analogist agent.
-    Generates descriptive prompts for educational diagrams and visualizations.
-    Enhanced with memory for personalized visual learning.
-    """
-    llm = get_llm()
-    
-    messages = state["messages"]
-    last_message = get_message_content(messages[-1]) if messages else ""
-    user_profile = state.get("user_profile", {})
-    memory_context = state.get("memory_context", "")
-    
-    # Adapt visual style based on user preferences
-    visual_style = ""
-    if user_profile:
-        if user_profile.get("interests"):
-            visual_style = f"Try to incorporate examples from: {', '.join(user_profile['interests'][:2])}"
-        if "technical" in str(user_profile.get("proficiencies", {})):
-            visual_style += " Can include more technical diagrams with detailed labels."
-    
-    system_prompt = f"""You are a visual learning specialist who creates educational diagrams.
+_VISUAL_PROMPT = """You are a visual learning specialist who creates educational diagrams.
     
     YOUR TASK:
     1. Analyze what concept the user is trying to understand
@@ -596,9 +498,9 @@ def visual_node(state: AgentState) -> AgentState:
     3. Generate a detailed image prompt for an AI image generator
     4. Explain how the visual connects to the concept
     
-    {f"PERSONALIZATION: {visual_style}" if visual_style else ""}
+    {personalization}
     
-    {memory_context if memory_context else ""}
+    {memory_context}
     
     IMAGE PROMPT GUIDELINES:
     - Be specific and detailed
@@ -618,59 +520,56 @@ def visual_node(state: AgentState) -> AgentState:
     ![description](https://image.pollinations.ai/prompt/YOUR_DETAILED_PROMPT_HERE)
     
     URL-encode spaces as %20 in the prompt."""
-    
-    chat_messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=last_message)
-    ]
-    
-    response = llm.invoke(chat_messages)
-    
-    state["messages"].append({
-        "role": "assistant",
-        "content": response.content
-    })
-    state["visual_requested"] = True
-    state["next_step"] = END
-    return state
 
 
-# Presentation Node - Slide generation
-def presentation_node(state: AgentState) -> AgentState:
+# Visual Node - Image generation agent
+async def visual_node(state: AgentState) -> Dict[str, Any]:
     """
-    Presentation Generator agent.
-    Creates structured JSON for PowerPoint slides on any topic.
-    Enhanced with memory for personalized presentation style.
+    Visual Analogist agent.
+    Generates descriptive prompts for educational diagrams and visualizations.
+    Enhanced with memory for personalized visual learning.
     """
-    llm = get_llm()
+    llm = get_llm(tier="flash")
     
     messages = state["messages"]
     last_message = get_message_content(messages[-1]) if messages else ""
-    user_profile = state.get("user_profile", {})
-    effective_strategies = state.get("effective_strategies", [])
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
+    memory_context = state.get("memory_context", "")
     
-    # Customize presentation style
-    style_guidance = ""
+    # Adapt visual style based on user preferences
+    visual_style = ""
     if user_profile:
         if user_profile.get("interests"):
-            style_guidance = f"Include examples related to: {', '.join(user_profile['interests'][:2])}"
-        level = "beginner" if not user_profile.get("proficiencies") else "intermediate to advanced"
-        style_guidance += f" Target the content for {level} level."
+            visual_style = f"Try to incorporate examples from: {', '.join(user_profile['interests'][:2])}"
+        if "technical" in str(user_profile.get("proficiencies", {})):
+            visual_style += " Can include more technical diagrams with detailed labels."
     
-    # Check effective strategies for presentation preferences
-    for strategy in effective_strategies:
-        if "visual" in strategy.get("description", "").lower():
-            style_guidance += " Include more visual slide prompts."
-            break
+    system_prompt = _VISUAL_PROMPT.format(
+        personalization=f"PERSONALIZATION: {visual_style}" if visual_style else "",
+        memory_context=memory_context or "",
+    )
+    
+    chat_messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=last_message)
+    ]
+    
+    response_content = await generate_response("visual", llm, chat_messages, state)
     
-    system_prompt = f"""You are an expert at creating educational presentations.
+    return {
+        "messages": [{"role": "assistant", "content": response_content}],
+        "visual_requested": True,
+        "next_step": END,
+    }
+
+
+_PRESENTATION_PROMPT = """You are an expert at creating educational presentations.
     
     Create a 5-7 slide presentation on the requested topic.
     
-    {f"PERSONALIZATION: {style_guidance}" if style_guidance else ""}
+    {personalization}
     
-    RESPOND WITH VALID JSON in this exact format:
-    ```json
+    RESPOND WITH JSON in this format:
     {{
       "slides": [
         {{
@@ -685,34 +584,65 @@ def presentation_node(state: AgentState) -> AgentState:
         }}
       ]
     }}
-    ```
     
     GUIDELINES:
     - First slide is always the title slide
     - Each content slide should have 3-5 bullet points
     - Include an imagePrompt for visual slides (or null if text-only)
     - Keep content concise and educational
-    - Use clear, simple language
+    - Use clear, simple language"""
+
+
+# Presentation Node - Slide generation
+async def presentation_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Presentation Generator agent.
+    Creates structured JSON for PowerPoint slides on any topic.
+    Uses Gemini's JSON mode, so the response parses without fence stripping.
+    Enhanced with memory for personalized presentation style.
+    """
+    llm = get_presentation_llm()
+    
+    messages = state["messages"]
+    last_message = get_message_content(messages[-1]) if messages else ""
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
+    effective_strategies = state.get("effective_strategies") or ()
+    
+    # Customize presentation style
+    style_guidance = ""
+    if user_profile:
+        if user_profile.get("interests"):
+            style_guidance = f"Include examples related to: {', '.join(user_profile['interests'][:2])}"
+        level = "beginner" if not user_profile.get("proficiencies") else "intermediate to advanced"
+        style_guidance += f" Target the content for {level} level."
+    
+    # Check effective strategies for presentation preferences
+    for strategy in effective_strategies:
+        if "visual" in strategy.get("description", "").lower():
+            style_guidance += " Include more visual slide prompts."
+            break
     
-    RESPOND ONLY WITH THE JSON, no additional text."""
+    system_prompt = _PRESENTATION_PROMPT.format(
+        personalization=f"PERSONALIZATION: {style_guidance}" if style_guidance else "",
+    )
     
     chat_messages = [
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Create a presentation about: {last_message}")
     ]
     
-    response = llm.invoke(chat_messages)
+    response_content = await generate_response("presentation", llm, chat_messages, state, stream=False)
     
     # Parse the JSON from the response
     try:
-        content = response.content
-        # Extract JSON from markdown code block if present
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        slides_data = json.loads(content.strip())
+        try:
+            slides_data = orjson.loads(response_content)
+        except orjson.JSONDecodeError:
+            # Fall back to a fenced payload if JSON mode was ignored
+            match = _JSON_FENCE.search(response_content)
+            if not match:
+                raise
+            slides_data = orjson.loads(match.group(1))
         
         # Format response with slides
         formatted_response = f"""📊 **Presentation Created!**
@@ -726,49 +656,28 @@ Click the **View Slides** button in the workspace panel to preview and download
         for i, slide in enumerate(slides_data.get("slides", [])):
             formatted_response += f"\n{i+1}. **{slide.get('title', 'Untitled')}**"
         
-        state["messages"].append({
+        reply = {
             "role": "assistant",
             "content": formatted_response,
             "metadata": {"slideData": slides_data.get("slides", [])}
-        })
+        }
         
-    except json.JSONDecodeError:
-        state["messages"].append({
+    except orjson.JSONDecodeError:
+        reply = {
             "role": "assistant",
-            "content": "I apologize, but I had trouble generating the slides. Let me try explaining the topic instead.\n\n" + response.content
-        })
+            "content": "I apologize, but I had trouble generating the slides. Let me try explaining the topic instead.\n\n" + response_content
+        }
     
-    state["next_step"] = END
-    return state
+    return {"messages": [reply], "next_step": END}
 
 
-# Feynman Node - Reverse teaching mode
-def feynman_node(state: AgentState) -> AgentState:
-    """
-    Feynman Technique Evaluator agent.
-    User explains concepts to the AI, which acts as a curious novice.
-    Enhanced with memory to track explanation progress.
-    """
-    llm = get_llm()
-    
-    messages = state["messages"]
-    user_profile = state.get("user_profile", {})
-    memory_context = state.get("memory_context", "")
-    
-    # Adapt based on what user has successfully explained before
-    progress_note = ""
-    if user_profile.get("proficiencies"):
-        strong_areas = [k for k, v in user_profile.get("proficiencies", {}).items() if isinstance(v, dict) and v.get("level") == "high"]
-        if strong_areas:
-            progress_note = f"The user has shown strong understanding in: {', '.join(strong_areas)}. Challenge them more in these areas."
-    
-    system_prompt = f"""You are implementing the Feynman Technique for learning.
+_FEYNMAN_PROMPT = """You are implementing the Feynman Technique for learning.
     
     YOUR ROLE: Act as a curious, intelligent novice who wants to learn.
     
-    {f"CONTEXT: {progress_note}" if progress_note else ""}
+    {progress_note}
     
-    {memory_context if memory_context else ""}
+    {memory_context}
     
     WHEN USER EXPLAINS SOMETHING:
     1. Listen carefully to their explanation
@@ -790,52 +699,45 @@ def feynman_node(state: AgentState) -> AgentState:
     If their explanation is complete and clear, congratulate them! 🎉
     
     Also note if they've improved in explaining this topic compared to before."""
-    
-    chat_messages = [SystemMessage(content=system_prompt)]
-    for msg in messages[-8:]:
-        if get_message_role(msg) == "user":
-            chat_messages.append(HumanMessage(content=get_message_content(msg)))
-        else:
-            chat_messages.append(AIMessage(content=get_message_content(msg)))
-    
-    response = llm.invoke(chat_messages)
-    
-    state["messages"].append({
-        "role": "assistant",
-        "content": response.content
-    })
-    state["next_step"] = END
-    return state
 
 
-# Devil's Advocate Node - Critical thinking
-def advocate_node(state: AgentState) -> AgentState:
+# Feynman Node - Reverse teaching mode
+async def feynman_node(state: AgentState) -> Dict[str, Any]:
     """
-    Devil's Advocate agent for critical thinking exercises.
-    Challenges user's positions to strengthen argumentation skills.
-    Enhanced with memory to adapt debate difficulty.
+    Feynman Technique Evaluator agent.
+    User explains concepts to the AI, which acts as a curious novice.
+    Enhanced with memory to track explanation progress.
     """
     llm = get_llm()
     
     messages = state["messages"]
-    user_profile = state.get("user_profile", {})
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
     memory_context = state.get("memory_context", "")
-    effective_strategies = state.get("effective_strategies", [])
     
-    # Adapt debate style based on user's debating history
-    debate_style = ""
-    if user_profile:
-        if user_profile.get("interests"):
-            debate_style = f"Can use examples from: {', '.join(user_profile['interests'][:2])}"
+    # Adapt based on what user has successfully explained before
+    progress_note = ""
+    if user_profile.get("proficiencies"):
+        strong_areas = [k for k, v in user_profile.get("proficiencies", {}).items() if isinstance(v, dict) and v.get("level") == "high"]
+        if strong_areas:
+            progress_note = f"The user has shown strong understanding in: {', '.join(strong_areas)}. Challenge them more in these areas."
     
-    # Check if we know how intense to make the debate
-    for strategy in effective_strategies:
-        if "debate" in strategy.get("topic", "").lower() or "critical" in strategy.get("topic", "").lower():
-            if strategy.get("success_rate", 0) > 0.7:
-                debate_style += " Increase challenge level - user responds well to rigorous debate."
-            break
+    system_prompt = _FEYNMAN_PROMPT.format(
+        progress_note=f"CONTEXT: {progress_note}" if progress_note else "",
+        memory_context=memory_context or "",
+    )
+    
+    chat_messages = [SystemMessage(content=system_prompt)]
+    chat_messages.extend(build_history(messages, 8))
     
-    system_prompt = f"""You are a Devil's Advocate for educational debate practice.
+    response_content = await generate_response("feynman", llm, chat_messages, state)
+    
+    return {
+        "messages": [{"role": "assistant", "content": response_content}],
+        "next_step": END,
+    }
+
+
+_ADVOCATE_PROMPT = """You are a Devil's Advocate for educational debate practice.
     
     YOUR MISSION:
     1. Take the opposing viewpoint to the user's position
@@ -843,9 +745,9 @@ def advocate_node(state: AgentState) -> AgentState:
     3. Challenge their assumptions respectfully
     4. Score their rebuttals on logic and evidence (not agreement)
     
-    {f"STYLE ADJUSTMENTS: {debate_style}" if debate_style else ""}
+    {style_adjustments}
     
-    {memory_context if memory_context else ""}
+    {memory_context}
     
     RULES:
     - Be intellectually rigorous but not combative
@@ -864,22 +766,49 @@ def advocate_node(state: AgentState) -> AgentState:
     
     ---
     *Remember: This is an exercise in critical thinking, not a personal debate.*"""
+
+
+# Devil's Advocate Node - Critical thinking
+async def advocate_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Devil's Advocate agent for critical thinking exercises.
+    Challenges user's positions to strengthen argumentation skills.
+    Enhanced with memory to adapt debate difficulty.
+    """
+    llm = get_llm()
+    
+    messages = state["messages"]
+    user_profile = state.get("user_profile") or _EMPTY_PROFILE
+    memory_context = state.get("memory_context", "")
+    effective_strategies = state.get("effective_strategies") or ()
+    
+    # Adapt debate style based on user's debating history
+    debate_style = ""
+    if user_profile:
+        if user_profile.get("interests"):
+            debate_style = f"Can use examples from: {', '.join(user_profile['interests'][:2])}"
+    
+    # Check if we know how intense to make the debate
+    for strategy in effective_strategies:
+        if "debate" in strategy.get("topic", "").lower() or "critical" in strategy.get("topic", "").lower():
+            if strategy.get("success_rate", 0) > 0.7:
+                debate_style += " Increase challenge level - user responds well to rigorous debate."
+            break
+    
+    system_prompt = _ADVOCATE_PROMPT.format(
+        style_adjustments=f"STYLE ADJUSTMENTS: {debate_style}" if debate_style else "",
+        memory_context=memory_context or "",
+    )
     
     chat_messages = [SystemMessage(content=system_prompt)]
-    for msg in messages[-8:]:
-        if get_message_role(msg) == "user":
-            chat_messages.append(HumanMessage(content=get_message_content(msg)))
-        else:
-            chat_messages.append(AIMessage(content=get_message_content(msg)))
+    chat_messages.extend(build_history(messages, 8))
     
-    response = llm.invoke(chat_messages)
+    response_content = await generate_response("advocate", llm, chat_messages, state)
     
-    state["messages"].append({
-        "role": "assistant",
-        "content": response.content
-    })
-    state["next_step"] = END
-    return state
+    return {
+        "messages": [{"role": "assistant", "content": response_content}],
+        "next_step": END,
+    }
 
 
 # Router function for conditional edges
@@ -892,12 +821,15 @@ def route_to_agent(state: AgentState) -> str:
 def create_tutor_graph() -> StateGraph:
     """
     Creates and compiles the LangGraph workflow for the AI Tutor.
+    Agent nodes are coroutines, so run the graph with `await graph.ainvoke(state)`
+    (or `astream`) rather than the blocking `invoke`.
     """
     # Initialize the graph
     workflow = StateGraph(AgentState)
     
-    # Add nodes
+    # Add nodes (supervisor routing is already memoized by _cached_route_agent)
     workflow.add_node("supervisor", supervisor_node)
+    workflow.add_node("memory", memory_node)
     workflow.add_node("tutor", tutor_node)
     workflow.add_node("rag", rag_node)
     workflow.add_node("visual", visual_node)
@@ -905,8 +837,11 @@ def create_tutor_graph() -> StateGraph:
     workflow.add_node("feynman", feynman_node)
     workflow.add_node("advocate", advocate_node)
     
-    # Set entry point
-    workflow.set_entry_point("supervisor")
+    # Routing and memory loading run in parallel in the first step; the
+    # chosen agent runs in the next step, once both have finished
+    workflow.add_edge(START, "supervisor")
+    workflow.add_edge(START, "memory")
+    workflow.add_edge("memory", END)
     
     # Add conditional edges from supervisor to specialized agents
     workflow.add_conditional_edges(
@@ -932,3 +867,11 @@ def create_tutor_graph() -> StateGraph:
     
     # Compile and return
     return workflow.compile()
+
+
+# Compiled on first use rather than at import: /api/chat imports this module
+# at startup but never runs the graph
+@functools.lru_cache(maxsize=1)
+def get_tutor_graph():
+    """Get the shared compiled tutor graph."""
+    return create_tutor_graph()
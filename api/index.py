@@ -1,129 +1,375 @@
 """
 Agentic AI Tutor - FastAPI Backend
 Main entry point for Vercel serverless deployment
-Uses lazy imports to avoid cold start issues
+Imports the chat agent at startup; other services are imported lazily
 """
 
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 from typing import Optional, List, Dict, Any
 import os
-import json
+import re
 import sys
+import asyncio
+import hashlib
+import orjson
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Make api/ importable as the top-level package root (agents, services),
+# once, even if this module is loaded more than once
+_API_DIR = os.path.dirname(os.path.abspath(__file__))
+if _API_DIR not in sys.path:
+    sys.path.insert(0, _API_DIR)
+
+# Credentials are fixed for the life of the process, so read them once
+_HF_TOKEN = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
+_GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+
+# Slide markers and markdown cleanup, compiled once
+_SLIDE_RE = re.compile(r'---SLIDE\s*\d*---\s*(.*?)---END SLIDE---', re.DOTALL | re.IGNORECASE)
+# First complete <svg ...>...</svg> element in a diagram response
+_SVG_RE = re.compile(r'<svg\b[^>]*>.*?</svg>', re.IGNORECASE | re.DOTALL)
+# Bold, italic (either marker) and a leading header marker in one pattern;
+# the emphasis alternatives capture the text to keep
+_MD_RE = re.compile(r'\*\*([^*]+)\*\*|__([^_]+)__|\*([^*]+)\*|_([^_]+)_|^#+\s*')
+
+
+def _md_keep(match: re.Match) -> str:
+    return match.group(match.lastindex) if match.lastindex else ''
+
+
+def clean_line(text: str) -> str:
+    """Clean a single line of text."""
+    # Remove markdown bold/italic/header markers; repeat only while a pass
+    # still changes something, which unwraps nested emphasis like ***x***
+    while True:
+        cleaned = _MD_RE.sub(_md_keep, text)
+        if cleaned == text:
+            return cleaned.strip()
+        text = cleaned
+
+
+_BULLET = '• '
+_SECTION_INITIALS = frozenset('tTiIcC')
+# Slide section keywords (text before the colon, lower-cased) -> section
+_SECTIONS = {
+    'title': 'title',
+    'image': 'image',
+    'image suggestion': 'image',
+    'content': 'content',
+}
+_BULLET_MARKERS = ('•', '-', '*')
+
+
+def _to_bullet(cleaned: str) -> str:
+    """Normalize a body line to a single '• ' bullet, whatever marker it had."""
+    if cleaned.startswith(_BULLET_MARKERS):
+        cleaned = cleaned.lstrip('•-* ')
+    return _BULLET + cleaned
+
+
+def _parse_slide(match: str, is_title_slide: bool) -> Optional[Dict[str, str]]:
+    """Parse the text between one pair of slide markers; None if it is empty."""
+    slide = {
+        "title": "",
+        "body": "",
+        "imagePrompt": ""
+    }
+    
+    lines = match.strip().split('\n')
+    body_lines = []
+    in_content = False
+    
+    for line in lines:
+        line_stripped = line.strip()
+        
+        # One lookup on the text before the first colon finds the section
+        # keyword; only lines that could start one are checked at all
+        section = None
+        if line_stripped[:1] in _SECTION_INITIALS:
+            keyword, colon, rest = line_stripped.partition(':')
+            if colon:
+                section = _SECTIONS.get(keyword.lower())
+        
+        # Parse title
+        if section == 'title':
+            slide["title"] = clean_line(rest.strip())
+            in_content = False
+        # Parse image prompt
+        elif section == 'image':
+            img_prompt = rest.strip()
+            if img_prompt and len(img_prompt) > 10:
+                slide["imagePrompt"] = img_prompt
+            in_content = False
+        # Start of content section
+        elif section == 'content':
+            in_content = True
+            # Check if there's content on the same line
+            rest = rest.strip()
+            if rest:
+                cleaned = clean_line(rest)
+                # For title slide, don't add bullets to subtitle
+                body_lines.append(cleaned if is_title_slide else _to_bullet(cleaned))
+        # Body content lines
+        elif line_stripped and in_content:
+            cleaned = clean_line(line_stripped)
+            if cleaned:
+                if is_title_slide:
+                    # Title slide content is a subtitle: strip bullet markers
+                    if cleaned.startswith(_BULLET_MARKERS):
+                        cleaned = cleaned.lstrip('•-* ').strip()
+                    body_lines.append(cleaned)
+                else:
+                    # For content slides, ensure bullet format
+                    body_lines.append(_to_bullet(cleaned))
+        elif line_stripped and line_stripped[:5].lower() != 'image':
+            # Capture any other content that might be body text
+            cleaned = clean_line(line_stripped)
+            if cleaned and len(cleaned) > 3:
+                if cleaned.startswith(_BULLET_MARKERS):
+                    cleaned = _to_bullet(cleaned)
+                body_lines.append(cleaned)
+    
+    slide["body"] = '\n'.join(body_lines)
+    
+    if slide["title"] or slide["body"]:
+        return slide
+    return None
 
 
 # Helper function to parse presentation slides from LLM response
 def parse_presentation_slides(content: str):
     """Parse the LLM response into structured slide data with proper bullet points."""
     slides = []
-    import re
     
     # Split by slide markers
-    slide_pattern = r'---SLIDE\s*\d*---\s*(.*?)---END SLIDE---'
-    matches = re.findall(slide_pattern, content, re.DOTALL | re.IGNORECASE)
-    
-    def clean_line(text: str) -> str:
-        """Clean a single line of text."""
-        # Remove markdown bold/italic markers
-        text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
-        text = re.sub(r'__([^_]+)__', r'\1', text)
-        text = re.sub(r'\*([^*]+)\*', r'\1', text)
-        text = re.sub(r'_([^_]+)_', r'\1', text)
-        # Remove header markers
-        text = re.sub(r'^#+\s*', '', text)
-        return text.strip()
+    matches = _SLIDE_RE.findall(content)
+    if not matches:
+        return None
     
     for i, match in enumerate(matches):
-        slide = {
-            "title": "",
-            "body": "",
-            "imagePrompt": ""
-        }
-        
-        lines = match.strip().split('\n')
-        body_lines = []
-        in_content = False
-        is_title_slide = (i == 0)  # First slide is always title slide
-        
-        for line in lines:
-            line_stripped = line.strip()
-            line_lower = line_stripped.lower()
-            
-            # Parse title
-            if line_lower.startswith('title:'):
-                slide["title"] = clean_line(line_stripped[6:].strip())
-                in_content = False
-            # Parse image prompt
-            elif line_lower.startswith('image suggestion:') or line_lower.startswith('image:'):
-                img_prompt = line_stripped.split(':', 1)[1].strip()
-                if img_prompt and len(img_prompt) > 10:
-                    slide["imagePrompt"] = img_prompt
-                in_content = False
-            # Start of content section
-            elif line_lower.startswith('content:'):
-                in_content = True
-                # Check if there's content on the same line
-                rest = line_stripped[8:].strip()
-                if rest:
-                    cleaned = clean_line(rest)
-                    # For title slide, don't add bullets to subtitle
-                    if is_title_slide:
-                        body_lines.append(cleaned)
-                    else:
-                        body_lines.append('• ' + cleaned if not cleaned.startswith('•') else cleaned)
-            # Body content lines
-            elif line_stripped and in_content:
-                cleaned = clean_line(line_stripped)
-                if cleaned:
-                    # For title slide, preserve as subtitle (no bullets)
-                    if is_title_slide:
-                        # Don't add bullet markers to title slide content
-                        if cleaned.startswith(('•', '-', '*')):
-                            cleaned = cleaned.lstrip('•-* ').strip()
-                        body_lines.append(cleaned)
-                    else:
-                        # For content slides, ensure bullet format
-                        if cleaned.startswith(('•', '-', '*')):
-                            cleaned = '• ' + cleaned.lstrip('•-* ')
-                        else:
-                            cleaned = '• ' + cleaned
-                        body_lines.append(cleaned)
-                        cleaned = '• ' + cleaned
-                    body_lines.append(cleaned)
-            elif line_stripped and not line_lower.startswith(('title:', 'image', 'content:')):
-                # Capture any other content that might be body text
-                cleaned = clean_line(line_stripped)
-                if cleaned and len(cleaned) > 3:
-                    if cleaned.startswith(('•', '-', '*')):
-                        cleaned = '• ' + cleaned.lstrip('•-* ')
-                    body_lines.append(cleaned)
-        
-        slide["body"] = '\n'.join(body_lines)
-        
-        if slide["title"] or slide["body"]:
+        # First slide is always title slide
+        slide = _parse_slide(match, is_title_slide=(i == 0))
+        if slide:
             slides.append(slide)
     
     return slides if slides else None
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """App lifecycle: optionally pre-warm connections, release them on shutdown."""
+    if os.getenv("WARMUP") == "1":
+        from agents.chat import warmup_http_clients
+        await warmup_http_clients()
+    yield
+    # The chat module may have failed to import; only close what was loaded
+    chat_module = sys.modules.get("agents.chat")
+    if chat_module is not None:
+        await chat_module.close_http_clients()
+    if _IMAGE_CLIENT is not None and _IMAGE_CLIENT_LOOP is asyncio.get_running_loop():
+        await _IMAGE_CLIENT.aclose()
+
+
+# Pooled client for the image API, created on the first image request since
+# most instances never serve one. Its connections belong to the event loop
+# that opened them, so it is rebuilt when called from a different loop
+_IMAGE_CLIENT = None
+_IMAGE_CLIENT_LOOP = None
+
+
+def _get_image_client():
+    global _IMAGE_CLIENT, _IMAGE_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _IMAGE_CLIENT is None or _IMAGE_CLIENT_LOOP is not loop:
+        import httpx
+        _IMAGE_CLIENT_LOOP = loop
+        _IMAGE_CLIENT = httpx.AsyncClient(
+            timeout=120.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+    return _IMAGE_CLIENT
+
+
+def _sse(payload: Dict[str, Any]) -> ServerSentEvent:
+    """Wrap a JSON payload in a server-sent event."""
+    return ServerSentEvent(data=orjson.dumps(payload).decode())
+
+
+# Words per streamed token frame; batching cuts per-frame encode/write overhead
+_WORDS_PER_FRAME = int(os.getenv("STREAM_WORDS_PER_FRAME", "8"))
+
+
+def _token_chunks(text: str, words_per_chunk: int = _WORDS_PER_FRAME):
+    """Split text into space-preserving chunks of a few words for streaming."""
+    words = text.split(' ')
+    for i in range(0, len(words), words_per_chunk):
+        chunk = ' '.join(words[i:i + words_per_chunk])
+        yield chunk + (' ' if i + words_per_chunk < len(words) else '')
+
+
+# Live model output is forwarded once this many characters have accumulated
+_STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "48"))
+_SLIDE_END_RE = re.compile(r'---END SLIDE---', re.IGNORECASE)
+
+
+async def _stream_model_text(deltas, parts: List[str], track_slides: bool = False):
+    """
+    Forward streamed model deltas as SSE token frames, batched by size, and
+    collect them into `parts`. With track_slides, each slide is parsed as soon
+    as its end marker arrives and the slides so far are sent as slideData.
+    """
+    pending: List[str] = []
+    pending_chars = 0
+    slide_buf = ""
+    slides: List[Dict[str, str]] = []
+    slide_count = 0
+    
+    async for delta in deltas:
+        parts.append(delta)
+        pending.append(delta)
+        pending_chars += len(delta)
+        if pending_chars >= _STREAM_FLUSH_CHARS:
+            yield _sse({'token': ''.join(pending)})
+            pending.clear()
+            pending_chars = 0
+        
+        if not track_slides:
+            continue
+        slide_buf += delta
+        end = _SLIDE_END_RE.search(slide_buf)
+        while end:
+            segment, slide_buf = slide_buf[:end.end()], slide_buf[end.end():]
+            for match in _SLIDE_RE.findall(segment):
+                # Same numbering as parse_presentation_slides: first slide is the title
+                slide = _parse_slide(match, is_title_slide=(slide_count == 0))
+                slide_count += 1
+                if slide:
+                    slides.append(slide)
+                    if pending:
+                        yield _sse({'token': ''.join(pending)})
+                        pending.clear()
+                        pending_chars = 0
+                    yield _sse({'slideData': slides})
+            end = _SLIDE_END_RE.search(slide_buf)
+    
+    if pending:
+        yield _sse({'token': ''.join(pending)})
+
+
+# Per-process cap on concurrent model calls (Hugging Face chat + SD images).
+# A semaphore binds to the event loop it is first awaited on, so it and its
+# waiter count are rebuilt when the running loop changes
+_LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+_LLM_MAX_WAITERS = int(os.getenv("LLM_MAX_WAITERS", "32"))
+_llm_sem: Optional[asyncio.Semaphore] = None
+_llm_sem_loop = None
+_llm_waiting = 0
+
+
+def _get_llm_sem() -> asyncio.Semaphore:
+    global _llm_sem, _llm_sem_loop, _llm_waiting
+    loop = asyncio.get_running_loop()
+    if _llm_sem is None or _llm_sem_loop is not loop:
+        _llm_sem_loop = loop
+        _llm_sem = asyncio.Semaphore(_LLM_CONCURRENCY)
+        _llm_waiting = 0
+    return _llm_sem
+
+
+@asynccontextmanager
+async def _llm_slot():
+    """Hold one of the LLM_CONCURRENCY model-call slots for the duration of a call."""
+    global _llm_waiting
+    sem = _get_llm_sem()
+    _llm_waiting += 1
+    try:
+        await sem.acquire()
+    finally:
+        _llm_waiting -= 1
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+# Interactive docs and the OpenAPI schema are only served when ENABLE_DOCS=1;
+# serverless instances never build the schema otherwise
+_DOCS_ENABLED = os.getenv("ENABLE_DOCS") == "1"
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Agentic AI Tutor API",
     description="Backend API for the Agentic AI Tutor - SDG 4 Quality Education",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+    openapi_url="/openapi.json" if _DOCS_ENABLED else None,
+    docs_url="/docs" if _DOCS_ENABLED else None,
+    redoc_url="/redoc" if _DOCS_ENABLED else None,
 )
 
+class HealthCheckMiddleware:
+    """
+    Answers GET /api/health before routing and response validation.
+    Configuration and module availability don't change within a process, so
+    a healthy body is serialized once and replayed afterwards; a body that
+    reports a module error is rebuilt on the next hit, so a transient first
+    failure isn't reported forever.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._body: Optional[bytes] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/api/health" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        body = self._body
+        if body is None:
+            payload = _health_payload()
+            body = orjson.dumps(payload)
+            if all(status == "ok" for status in payload["modules"].values()):
+                self._body = body
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Added before CORS: the last middleware added is the outermost, so CORS
+# still wraps the health responses for browser checks
+app.add_middleware(HealthCheckMiddleware)
+
 # CORS Configuration
+# The frontend calls the API same-origin without cookies, so only the listed
+# origins (comma-separated) are allowed and credentials stay off
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in (os.getenv("ALLOWED_ORIGINS") or os.getenv("NEXT_PUBLIC_APP_URL", "http://localhost:3000")).split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=False,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["content-type", "authorization"],
 )
 
 
@@ -133,6 +379,9 @@ class ImageData(BaseModel):
     mimeType: str
 
 class ChatRequest(BaseModel):
+    # Validated once by FastAPI and then only read
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    
     message: str
     thread_id: str
     session_id: Optional[str] = None
@@ -140,6 +389,7 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = None
     tool: Optional[str] = "auto"  # auto, chat, report, presentation, image
     image: Optional[ImageData] = None
+    no_cache: bool = False  # Bypass the semantic response cache
 
 
 class ImageGenerationRequest(BaseModel):
@@ -159,49 +409,70 @@ class FeedbackRequest(BaseModel):
     feedback_text: Optional[str] = None
 
 
-# Lazy import helper
+# Lazy import helpers, memoized so each resolves its module once per process
+@lru_cache(maxsize=1)
 def get_tutor_modules():
-    """Lazy import tutor modules"""
-    from agents.supervisor import (
-        create_tutor_graph,
-        load_memory_context,
-        save_interaction_memory,
-    )
-    return create_tutor_graph, load_memory_context, save_interaction_memory
+    """Lazy import tutor modules (the graph is compiled once by the supervisor module)"""
+    from agents.supervisor import get_tutor_graph
+    from agents.chat import load_memory_context, save_interaction_memory
+    return get_tutor_graph, load_memory_context, save_interaction_memory
 
 
+@lru_cache(maxsize=1)
 def get_tts_module():
     """Lazy import TTS module"""
     from services.tts import generate_speech
     return generate_speech
 
 
+@lru_cache(maxsize=1)
 def get_document_module():
     """Lazy import document module"""
     from services.document import process_document
     return process_document
 
 
+@lru_cache(maxsize=1)
 def get_search_module():
     """Lazy import search module"""
     from services.search import web_search
     return web_search
 
 
+@lru_cache(maxsize=1)
 def get_memory_module():
-    """Lazy import memory module"""
+    """Lazy import memory module (returns the cached manager factory)"""
     try:
-        from services.memory import MemoryManager
-        return MemoryManager
+        from services.memory import get_manager
+        return get_manager
     except ImportError:
         return None
 
 
-# Health check endpoint
-@app.get("/api/health")
-async def health_check():
-    hf_token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
-    google_api_key = os.getenv("GOOGLE_API_KEY")
+# The chat path's helpers are imported during serverless init instead of on
+# the first request; an import failure is kept and reported by /api/chat so
+# the health check and other endpoints still come up. agents.chat stays clear
+# of langgraph and langchain_core, which only the tutor graph needs
+try:
+    from agents.chat import (
+        call_huggingface_llm,
+        stream_huggingface_llm,
+        auto_select_tool,
+        load_memory_context,
+        save_interaction_memory,
+        chat_cache,
+        CACHE_AVAILABLE,
+    )
+    _CHAT_IMPORT_ERROR = None
+except Exception as e:
+    _CHAT_IMPORT_ERROR = e
+    print(f"Warning: chat agent module failed to import: {e}")
+
+
+# Health check payload, served by HealthCheckMiddleware
+def _health_payload() -> Dict[str, Any]:
+    hf_token = _HF_TOKEN
+    google_api_key = _GOOGLE_API_KEY
     
     # Test imports
     modules_status = {}
@@ -242,10 +513,9 @@ async def generate_image_sd35(prompt: str, negative_prompt: str = None, width: i
     Generate an image using Stability AI's Stable Diffusion 3.5 Large via Hugging Face Inference API.
     Returns base64 encoded image data.
     """
-    import httpx
     import base64
     
-    hf_token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
+    hf_token = _HF_TOKEN
     if not hf_token:
         raise ValueError("HUGGINGFACE_API_KEY not configured")
     
@@ -271,29 +541,32 @@ async def generate_image_sd35(prompt: str, negative_prompt: str = None, width: i
     if negative_prompt:
         payload["parameters"]["negative_prompt"] = negative_prompt
     
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(api_url, headers=headers, json=payload)
-        
-        if response.status_code == 503:
-            # Model is loading, get estimated time
-            data = response.json()
-            estimated_time = data.get("estimated_time", 30)
-            raise Exception(f"Model is loading. Please wait approximately {estimated_time:.0f} seconds and try again.")
-        
-        if response.status_code != 200:
-            error_detail = response.text[:500]
-            raise Exception(f"Image generation failed (HTTP {response.status_code}): {error_detail}")
-        
-        # The response is the raw image bytes
-        image_bytes = response.content
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        return {
-            "image_base64": image_base64,
-            "mime_type": "image/jpeg",
-            "prompt": prompt,
-            "model": "stabilityai/stable-diffusion-3.5-large"
-        }
+    client = _get_image_client()
+    response = await client.post(api_url, headers=headers, json=payload)
+    
+    if response.status_code == 503:
+        # Model is loading, get estimated time
+        data = response.json()
+        estimated_time = data.get("estimated_time", 30)
+        raise Exception(f"Model is loading. Please wait approximately {estimated_time:.0f} seconds and try again.")
+    
+    if response.status_code != 200:
+        error_detail = response.text[:500]
+        raise Exception(f"Image generation failed (HTTP {response.status_code}): {error_detail}")
+    
+    # The response is the raw image bytes; base64 output is pure ASCII
+    image_base64 = base64.b64encode(response.content).decode('ascii')
+    
+    # Report the format the API actually returned
+    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+    mime_type = content_type if content_type.startswith("image/") else "image/jpeg"
+    
+    return {
+        "image_base64": image_base64,
+        "mime_type": mime_type,
+        "prompt": prompt,
+        "model": "stabilityai/stable-diffusion-3.5-large"
+    }
 
 
 # Image Generation Endpoint
@@ -317,9 +590,117 @@ async def generate_image(request: ImageGenerationRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# System prompts for the text and diagram tools of /api/chat
+_TOOL_PROMPTS = {
+    "chat": """You are a helpful AI tutor. Explain concepts clearly and provide examples when helpful. 
+Be encouraging and patient. Use markdown formatting for better readability.""",
+    
+    "report": """You are an expert report writer. Generate comprehensive, well-structured reports.
+IMPORTANT GUIDELINES:
+- Write detailed, multi-section reports with proper headings (## for main sections, ### for subsections)
+- Include an executive summary, introduction, main content sections, and conclusion
+- Use bullet points and numbered lists for clarity
+- Provide data, examples, and evidence where relevant
+- Make the report at least 1000 words for comprehensive coverage
+- Use proper markdown formatting throughout
+- End with key takeaways or recommendations""",
+    
+    "presentation": """You are an expert presentation designer. Create professional, content-rich presentations.
+
+CRITICAL: Follow this EXACT format for EVERY slide:
+
+---SLIDE 1---
+Title: [The exact topic/title from user's request]
+Content:
+[A descriptive subtitle that summarizes the presentation - this appears under the main title]
+---END SLIDE---
+
+---SLIDE 2---
+Title: Overview
+Content:
+• First main topic to be covered
+• Second main topic to be covered  
+• Third main topic to be covered
+• Fourth main topic to be covered
+---END SLIDE---
+
+---SLIDE 3---
+Title: [First Main Topic]
+Content:
+• Key point with specific details and facts
+• Another important aspect with examples
+• Supporting information or data point
+• Additional relevant detail or statistic
+• Summary or takeaway for this topic
+---END SLIDE---
+
+[Continue with more content slides...]
+
+---SLIDE [last]---
+Title: Summary & Key Takeaways
+Content:
+• Main conclusion point 1
+• Main conclusion point 2
+• Main conclusion point 3
+• Call to action or next steps
+---END SLIDE---
+
+CONTENT RULES - VERY IMPORTANT:
+1. SLIDE 1 (Title Slide): Title should be the EXACT topic from user's request. Content should be ONE LINE subtitle only.
+2. Use • (bullet character) for ALL bullet points in content slides
+3. Each bullet should be 10-20 words with specific facts, data, or examples
+4. NO markdown formatting (no **, no ##, no ``` anywhere in slides)
+5. Make content educational, detailed, and substantive
+6. Include ALL information the user mentioned in their prompt
+7. Create 7-10 slides for comprehensive coverage
+8. End with a summary/conclusion slide
+
+IMAGE RULES:
+• Do NOT include Image: line unless user EXPLICITLY asks for images in their prompt
+• If user asks for images, add: Image: [specific description for that slide]
+
+REMEMBER: The title slide's Content field should be a SINGLE LINE subtitle, not bullet points.""",
+    
+    "diagram": """You are an expert diagram creator. Generate SVG code for professional diagrams.
+
+IMPORTANT RULES:
+1. Output ONLY valid SVG code - no markdown, no explanation before the SVG
+2. Start directly with <svg> tag and end with </svg>
+3. Use a clean, modern design with proper spacing
+4. Include appropriate colors (use a professional palette)
+5. Add text labels inside the diagram
+6. Use rounded rectangles, circles, and arrows for flowcharts
+7. Ensure the diagram is readable and well-organized
+
+SVG GUIDELINES:
+- Set viewBox for responsive sizing (e.g., viewBox="0 0 800 600")
+- Use fill colors like #3B82F6 (blue), #10B981 (green), #F59E0B (amber), #EF4444 (red), #8B5CF6 (purple)
+- Use stroke for borders and arrows
+- Include <defs> for arrow markers if needed
+- Add drop shadows using <filter> for depth
+- Use <text> elements with proper font-family (Arial, sans-serif)
+
+DIAGRAM TYPES:
+- Flowcharts: Use rectangles connected by arrows
+- Block diagrams: Use rounded rectangles with labels
+- Process diagrams: Show steps with arrows
+- Hierarchy: Use tree structure
+- Comparison: Side-by-side boxes
+
+Generate a professional, visually appealing diagram based on the user's request.""",
+}
+
+
+# Generation budget per text tool (default 2048)
+_MAX_TOKENS = {
+    "report": 4096,  # Longer for reports
+    "presentation": 3072,  # Medium for presentations
+}
+
+
 # Main chat endpoint - uses Hugging Face Gemma-3-27b-it (FREE!)
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, raw: Request):
     """
     Main chat endpoint - uses Hugging Face Inference API with Gemma-3-27b-it.
     100% FREE with unlimited requests!
@@ -327,63 +708,61 @@ async def chat(request: ChatRequest):
     """
     try:
         # Check API key first
-        hf_token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HF_TOKEN")
+        hf_token = _HF_TOKEN
         if not hf_token:
             raise HTTPException(status_code=500, detail="HUGGINGFACE_API_KEY not configured. Get a free token at huggingface.co/settings/tokens")
         
-        # Lazy import
-        from agents.supervisor import call_huggingface_llm, supervisor_node, auto_select_tool
-        from agents.supervisor import load_memory_context, save_interaction_memory
+        # The agent module is imported at startup; surface its failure here
+        if _CHAT_IMPORT_ERROR is not None:
+            raise _CHAT_IMPORT_ERROR
         
         user_id = request.user_id or "anonymous"
         session_id = request.session_id or request.thread_id
         selected_tool = request.tool or "auto"
         
-        # Load memory context (no LLM calls, just database)
-        memory_data = await load_memory_context(user_id, session_id, request.message)
+        # Shed load up front instead of queueing without bound for a model slot
+        if _get_llm_sem().locked() and _llm_waiting >= _LLM_MAX_WAITERS:
+            raise HTTPException(
+                status_code=503,
+                detail="The tutor is busy right now. Please try again in a few seconds.",
+                headers={"Retry-After": "5"},
+            )
         
         # Auto-select tool if needed
         if selected_tool == "auto":
             selected_tool = auto_select_tool(request.message)
         
-        # Build state
-        state = {
-            "messages": [{"role": "user", "content": request.message}],
-            "user_id": user_id,
-            "session_id": session_id,
-            "language": request.language,
-            "visual_requested": False,
-            "next_step": "supervisor",
-            "rag_context": "",
-            "search_results": "",
-            "memory_context": memory_data.get("memory_context", ""),
-            "user_profile": memory_data.get("user_profile", {}),
-            "effective_strategies": memory_data.get("effective_strategies", []),
-            "current_topic": memory_data.get("current_topic"),
-            "extracted_facts": [],
-            "selected_tool": selected_tool,
-            "has_image": request.image is not None,
-        }
+        # Start loading memory context (no LLM calls, just database) in the
+        # background; it is awaited only right before the text prompt is built.
+        # Image and diagram generation don't use it, so they skip it entirely.
+        memory_task = None
+        if selected_tool not in ("image", "diagram"):
+            memory_task = asyncio.create_task(
+                load_memory_context(user_id, session_id, request.message)
+            )
         
         async def event_generator():
             """Generate SSE events with Hugging Face Gemma-3-27b-it"""
             try:
-                yield f"data: {json.dumps({'status': 'routing', 'tool': selected_tool})}\n\n"
+                yield _sse({'status': 'routing', 'tool': selected_tool})
                 
                 # Handle Image Generation Tool separately
                 if selected_tool == "image":
-                    yield f"data: {json.dumps({'status': 'generating_image'})}\n\n"
+                    yield _sse({'status': 'generating_image'})
                     
                     try:
                         # Generate the image using SD 3.5
-                        image_result = await generate_image_sd35(
-                            prompt=request.message,
-                            negative_prompt="blurry, low quality, distorted, deformed, ugly, bad anatomy",
-                            width=1024,
-                            height=1024,
-                            steps=28,
-                            guidance_scale=4.5
-                        )
+                        async with _llm_slot():
+                            if await raw.is_disconnected():
+                                return
+                            image_result = await generate_image_sd35(
+                                prompt=request.message,
+                                negative_prompt="blurry, low quality, distorted, deformed, ugly, bad anatomy",
+                                width=1024,
+                                height=1024,
+                                steps=28,
+                                guidance_scale=4.5
+                            )
                         
                         # Send a nice response with the image
                         response_text = f"""✨ **Image Generated Successfully!**
@@ -395,69 +774,41 @@ async def chat(request: ChatRequest):
 Your image has been generated and is displayed below. You can right-click to save it."""
                         
                         # Stream the text response
-                        words = response_text.split(' ')
-                        for i, word in enumerate(words):
-                            token = word + (' ' if i < len(words) - 1 else '')
-                            yield f"data: {json.dumps({'token': token})}\n\n"
+                        for token in _token_chunks(response_text):
+                            yield _sse({'token': token})
                         
                         # Send the image data
-                        yield f"data: {json.dumps({'generatedImage': image_result})}\n\n"
+                        yield _sse({'generatedImage': image_result})
                         
                         # Send completion
-                        yield f"data: {json.dumps({'done': True, 'tool_used': 'image'})}\n\n"
+                        yield _sse({'done': True, 'tool_used': 'image'})
                         return
                         
                     except Exception as img_error:
                         error_msg = str(img_error)
                         if "loading" in error_msg.lower():
-                            yield f"data: {json.dumps({'error': f'⏳ {error_msg}'})}\n\n"
+                            yield _sse({'error': f'⏳ {error_msg}'})
                         else:
-                            yield f"data: {json.dumps({'error': f'❌ Image generation failed: {error_msg}'})}\n\n"
+                            yield _sse({'error': f'❌ Image generation failed: {error_msg}'})
                         return
                 
                 # Handle Diagram Generation Tool
                 if selected_tool == "diagram":
-                    yield f"data: {json.dumps({'status': 'generating_diagram'})}\n\n"
+                    yield _sse({'status': 'generating_diagram'})
                     
-                    diagram_prompt = """You are an expert diagram creator. Generate SVG code for professional diagrams.
-
-IMPORTANT RULES:
-1. Output ONLY valid SVG code - no markdown, no explanation before the SVG
-2. Start directly with <svg> tag and end with </svg>
-3. Use a clean, modern design with proper spacing
-4. Include appropriate colors (use a professional palette)
-5. Add text labels inside the diagram
-6. Use rounded rectangles, circles, and arrows for flowcharts
-7. Ensure the diagram is readable and well-organized
-
-SVG GUIDELINES:
-- Set viewBox for responsive sizing (e.g., viewBox="0 0 800 600")
-- Use fill colors like #3B82F6 (blue), #10B981 (green), #F59E0B (amber), #EF4444 (red), #8B5CF6 (purple)
-- Use stroke for borders and arrows
-- Include <defs> for arrow markers if needed
-- Add drop shadows using <filter> for depth
-- Use <text> elements with proper font-family (Arial, sans-serif)
-
-DIAGRAM TYPES:
-- Flowcharts: Use rectangles connected by arrows
-- Block diagrams: Use rounded rectangles with labels
-- Process diagrams: Show steps with arrows
-- Hierarchy: Use tree structure
-- Comparison: Side-by-side boxes
-
-Generate a professional, visually appealing diagram based on the user's request."""
-
                     hf_messages = [
-                        {"role": "system", "content": diagram_prompt},
+                        {"role": "system", "content": _TOOL_PROMPTS["diagram"]},
                         {"role": "user", "content": f"Create an SVG diagram for: {request.message}"}
                     ]
                     
                     try:
-                        response_content = await call_huggingface_llm(hf_messages, max_tokens=3072)
+                        async with _llm_slot():
+                            if await raw.is_disconnected():
+                                return
+                            response_content = await call_huggingface_llm(hf_messages, max_tokens=3072)
                         
                         # Extract SVG from response
-                        import re
-                        svg_match = re.search(r'<svg[\s\S]*?</svg>', response_content, re.IGNORECASE)
+                        svg_match = _SVG_RE.search(response_content)
                         
                         if svg_match:
                             svg_code = svg_match.group(0)
@@ -474,100 +825,46 @@ You can:
 - **Copy** the code to use elsewhere
 
 """
-                            words = explanation.split(' ')
-                            for i, word in enumerate(words):
-                                token = word + (' ' if i < len(words) - 1 else '')
-                                yield f"data: {json.dumps({'token': token})}\n\n"
+                            for token in _token_chunks(explanation):
+                                yield _sse({'token': token})
                             
                             # Send diagram data
-                            yield f"data: {json.dumps({'diagramSvg': svg_code, 'diagramTitle': request.message[:50]})}\n\n"
-                            yield f"data: {json.dumps({'done': True, 'tool_used': 'diagram'})}\n\n"
+                            yield _sse({'diagramSvg': svg_code, 'diagramTitle': request.message[:50]})
+                            yield _sse({'done': True, 'tool_used': 'diagram'})
                         else:
                             # No SVG found, return the raw response
-                            words = response_content.split(' ')
-                            for i, word in enumerate(words):
-                                token = word + (' ' if i < len(words) - 1 else '')
-                                yield f"data: {json.dumps({'token': token})}\n\n"
-                            yield f"data: {json.dumps({'done': True, 'tool_used': 'diagram'})}\n\n"
+                            for token in _token_chunks(response_content):
+                                yield _sse({'token': token})
+                            yield _sse({'done': True, 'tool_used': 'diagram'})
                         return
                         
                     except Exception as diag_error:
-                        yield f"data: {json.dumps({'error': f'❌ Diagram generation failed: {str(diag_error)}'})}\n\n"
+                        yield _sse({'error': f'❌ Diagram generation failed: {str(diag_error)}'})
                         return
                 
                 # Build the prompt based on selected tool
-                tool_prompts = {
-                    "chat": """You are a helpful AI tutor. Explain concepts clearly and provide examples when helpful. 
-Be encouraging and patient. Use markdown formatting for better readability.""",
-                    
-                    "report": """You are an expert report writer. Generate comprehensive, well-structured reports.
-IMPORTANT GUIDELINES:
-- Write detailed, multi-section reports with proper headings (## for main sections, ### for subsections)
-- Include an executive summary, introduction, main content sections, and conclusion
-- Use bullet points and numbered lists for clarity
-- Provide data, examples, and evidence where relevant
-- Make the report at least 1000 words for comprehensive coverage
-- Use proper markdown formatting throughout
-- End with key takeaways or recommendations""",
-                    
-                    "presentation": """You are an expert presentation designer. Create professional, content-rich presentations.
-
-CRITICAL: Follow this EXACT format for EVERY slide:
-
----SLIDE 1---
-Title: [The exact topic/title from user's request]
-Content:
-[A descriptive subtitle that summarizes the presentation - this appears under the main title]
----END SLIDE---
-
----SLIDE 2---
-Title: Overview
-Content:
-• First main topic to be covered
-• Second main topic to be covered  
-• Third main topic to be covered
-• Fourth main topic to be covered
----END SLIDE---
-
----SLIDE 3---
-Title: [First Main Topic]
-Content:
-• Key point with specific details and facts
-• Another important aspect with examples
-• Supporting information or data point
-• Additional relevant detail or statistic
-• Summary or takeaway for this topic
----END SLIDE---
-
-[Continue with more content slides...]
-
----SLIDE [last]---
-Title: Summary & Key Takeaways
-Content:
-• Main conclusion point 1
-• Main conclusion point 2
-• Main conclusion point 3
-• Call to action or next steps
----END SLIDE---
-
-CONTENT RULES - VERY IMPORTANT:
-1. SLIDE 1 (Title Slide): Title should be the EXACT topic from user's request. Content should be ONE LINE subtitle only.
-2. Use • (bullet character) for ALL bullet points in content slides
-3. Each bullet should be 10-20 words with specific facts, data, or examples
-4. NO markdown formatting (no **, no ##, no ``` anywhere in slides)
-5. Make content educational, detailed, and substantive
-6. Include ALL information the user mentioned in their prompt
-7. Create 7-10 slides for comprehensive coverage
-8. End with a summary/conclusion slide
-
-IMAGE RULES:
-• Do NOT include Image: line unless user EXPLICITLY asks for images in their prompt
-• If user asks for images, add: Image: [specific description for that slide]
-
-REMEMBER: The title slide's Content field should be a SINGLE LINE subtitle, not bullet points.""",
-                }
+                system_prompt = _TOOL_PROMPTS.get(selected_tool, _TOOL_PROMPTS["chat"])
                 
-                system_prompt = tool_prompts.get(selected_tool, tool_prompts["chat"])
+                memory_data = await memory_task
+                
+                # Build state
+                state = {
+                    "messages": [{"role": "user", "content": request.message}],
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "language": request.language,
+                    "visual_requested": False,
+                    "next_step": "supervisor",
+                    "rag_context": "",
+                    "search_results": "",
+                    "memory_context": memory_data.get("memory_context", ""),
+                    "user_profile": memory_data.get("user_profile", {}),
+                    "effective_strategies": memory_data.get("effective_strategies", []),
+                    "current_topic": memory_data.get("current_topic"),
+                    "extracted_facts": [],
+                    "selected_tool": selected_tool,
+                    "has_image": request.image is not None,
+                }
                 
                 # Add memory context if available
                 if state.get("memory_context"):
@@ -579,69 +876,89 @@ REMEMBER: The title slide's Content field should be a SINGLE LINE subtitle, not
                     {"role": "user", "content": request.message}
                 ]
                 
-                yield f"data: {json.dumps({'status': 'generating'})}\n\n"
+                yield _sse({'status': 'generating'})
                 
                 # Adjust max tokens based on tool type
-                max_tokens = 2048
-                if selected_tool == "report":
-                    max_tokens = 4096  # Longer for reports
-                elif selected_tool == "presentation":
-                    max_tokens = 3072  # Medium for presentations
+                max_tokens = _MAX_TOKENS.get(selected_tool, 2048)
+                
+                # Serve near-identical questions from the semantic cache. The
+                # prompt carries the user's memory context, so entries are
+                # scoped per user as well as per tool and language.
+                cache_scope = None
+                if CACHE_AVAILABLE and not request.no_cache:
+                    cache_scope = f"{user_id}:chat-{selected_tool}:{request.language}"
+                
+                response_content = None
+                if cache_scope:
+                    response_content = await chat_cache.alookup(request.message, scope=cache_scope)
                 
-                # Call Hugging Face API (ONE call)
-                response_content = await call_huggingface_llm(hf_messages, max_tokens=max_tokens)
+                if response_content is None:
+                    # Stream from Hugging Face (ONE call) as it generates,
+                    # unless the client gave up while queued for a slot
+                    parts = []
+                    async with _llm_slot():
+                        if await raw.is_disconnected():
+                            return
+                        deltas = stream_huggingface_llm(hf_messages, max_tokens=max_tokens)
+                        async for frame in _stream_model_text(deltas, parts, track_slides=(selected_tool == "presentation")):
+                            yield frame
+                    response_content = ''.join(parts)
+                    if cache_scope:
+                        await chat_cache.aupdate(request.message, response_content, scope=cache_scope)
+                else:
+                    # Cached answer: replay it in word groups
+                    for token in _token_chunks(response_content):
+                        yield _sse({'token': token})
                 
                 # Parse presentation slides if applicable
                 slide_data = None
                 if selected_tool == "presentation" and "---SLIDE" in response_content:
                     slide_data = parse_presentation_slides(response_content)
                 
-                # Stream the complete response as tokens (simulated streaming)
-                words = response_content.split(' ')
-                for i, word in enumerate(words):
-                    token = word + (' ' if i < len(words) - 1 else '')
-                    yield f"data: {json.dumps({'token': token})}\n\n"
+                # Send completion with metadata
+                completion_data = {'done': True, 'tool_used': selected_tool}
+                if slide_data:
+                    completion_data['slideData'] = slide_data
+                
+                yield _sse(completion_data)
                 
-                # Save to memory (no LLM call)
+                # Save to memory (no LLM call) after the done event but before
+                # the response ends: a serverless instance may be frozen once
+                # it does, so a detached task might never run. Shielded so a
+                # client closing the stream on done doesn't cancel the write.
                 try:
-                    await save_interaction_memory(
+                    await asyncio.shield(save_interaction_memory(
                         user_id=user_id,
                         session_id=session_id,
                         user_message=request.message,
                         assistant_response=response_content,
                         topic=memory_data.get("current_topic"),
                         extracted_facts=[]
-                    )
+                    ))
                 except Exception as mem_error:
                     print(f"Memory save error (non-critical): {mem_error}")
                 
-                # Send completion with metadata
-                completion_data = {'done': True, 'tool_used': selected_tool}
-                if slide_data:
-                    completion_data['slideData'] = slide_data
-                
-                yield f"data: {json.dumps(completion_data)}\n\n"
-                
             except Exception as e:
                 error_msg = str(e)
                 # Provide user-friendly error messages
                 if "401" in error_msg or "Unauthorized" in error_msg:
-                    yield f"data: {json.dumps({'error': '⚠️ Invalid Hugging Face token. Please check your HUGGINGFACE_API_KEY.'})}\n\n"
+                    yield _sse({'error': '⚠️ Invalid Hugging Face token. Please check your HUGGINGFACE_API_KEY.'})
                 elif "503" in error_msg or "Service Unavailable" in error_msg:
-                    yield f"data: {json.dumps({'error': '⚠️ Hugging Face model is loading. Please wait 30 seconds and try again.'})}\n\n"
+                    yield _sse({'error': '⚠️ Hugging Face model is loading. Please wait 30 seconds and try again.'})
                 else:
-                    yield f"data: {json.dumps({'error': f'Error: {error_msg}'})}\n\n"
+                    yield _sse({'error': f'Error: {error_msg}'})
+            finally:
+                # EventSourceResponse cancels this generator when the client
+                # disconnects; don't leave the memory lookup running
+                if memory_task is not None and not memory_task.done():
+                    memory_task.cancel()
         
-        return StreamingResponse(
-            event_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
-        )
+        # EventSourceResponse frames each event and sets the no-cache /
+        # keep-alive / no-buffering headers itself
+        return EventSourceResponse(event_generator(), sep="\n")
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -658,6 +975,7 @@ async def text_to_speech(text: str, voice: str = "en-US-AriaNeural", rate: str =
             audio_stream,
             media_type="audio/mpeg",
             headers={
+                "Cache-Control": "public, max-age=86400",
                 "Content-Disposition": "inline; filename=speech.mp3"
             }
         )
@@ -675,14 +993,24 @@ async def ingest_document(file: UploadFile = File(...)):
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
-        content = await file.read()
-        result = await process_document(content, file.filename)
+        # Hash the upload in 1 MiB chunks and hand pypdf the spooled file
+        # itself, instead of copying the whole PDF into a bytes object
+        digest = hashlib.sha256()
+        while chunk := await file.read(1 << 20):
+            digest.update(chunk)
+        await file.seek(0)
+        
+        result = await process_document(file.file, file.filename, sha256=digest.hexdigest())
         
         return {
             "success": True,
             "filename": file.filename,
-            "chunks_created": result.get("chunks_created", 0),
-            "message": "Document processed and indexed successfully"
+            "chunks_created": result.get("chunks_count", 0),
+            "message": (
+                "Document was already indexed"
+                if result.get("duplicate")
+                else "Document processed and indexed successfully"
+            )
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -693,17 +1021,17 @@ async def ingest_document(file: UploadFile = File(...)):
 async def get_memory_profile(user_id: str):
     """Get user's memory profile including learning style and preferences."""
     try:
-        MemoryManager = get_memory_module()
-        if not MemoryManager:
-            return {"error": "Memory system not available"}
+        get_manager = get_memory_module()
+        if not get_manager:
+            return ORJSONResponse({"error": "Memory system not available"})
         
-        manager = MemoryManager(user_id, "profile")
+        manager = get_manager(user_id, "profile")
         profile = await manager.get_user_profile()
         
-        return {
+        return ORJSONResponse({
             "user_id": user_id,
             "profile": profile
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -712,14 +1040,14 @@ async def get_memory_profile(user_id: str):
 async def get_memory_context(user_id: str, session_id: str, query: str = ""):
     """Get relevant memory context for a query."""
     try:
-        MemoryManager = get_memory_module()
-        if not MemoryManager:
-            return {"context": "", "error": "Memory system not available"}
+        get_manager = get_memory_module()
+        if not get_manager:
+            return ORJSONResponse({"context": "", "error": "Memory system not available"})
         
-        manager = MemoryManager(user_id, session_id)
+        manager = get_manager(user_id, session_id)
         context = await manager.build_context_for_query(query)
         
-        return context
+        return ORJSONResponse(context)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -728,18 +1056,18 @@ async def get_memory_context(user_id: str, session_id: str, query: str = ""):
 async def submit_feedback(request: FeedbackRequest):
     """Submit feedback on a response for memory system learning."""
     try:
-        MemoryManager = get_memory_module()
-        if not MemoryManager:
-            return {"success": False, "error": "Memory system not available"}
+        get_manager = get_memory_module()
+        if not get_manager:
+            return ORJSONResponse({"success": False, "error": "Memory system not available"})
         
-        manager = MemoryManager(request.user_id, request.session_id)
+        manager = get_manager(request.user_id, request.session_id)
         await manager.record_feedback(
             message_id=request.message_id,
             was_helpful=request.was_helpful,
             feedback_text=request.feedback_text
         )
         
-        return {"success": True}
+        return ORJSONResponse({"success": True})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -748,13 +1076,13 @@ async def submit_feedback(request: FeedbackRequest):
 async def consolidate_memories(user_id: str, session_id: str = None):
     """Consolidate working memory into long-term storage."""
     try:
-        MemoryManager = get_memory_module()
-        if not MemoryManager:
-            return {"success": False, "error": "Memory system not available"}
+        get_manager = get_memory_module()
+        if not get_manager:
+            return ORJSONResponse({"success": False, "error": "Memory system not available"})
         
-        manager = MemoryManager(user_id, session_id or "consolidation")
+        manager = get_manager(user_id, session_id or "consolidation")
         await manager.consolidate_session()
         
-        return {"success": True, "message": "Memories consolidated"}
+        return ORJSONResponse({"success": True, "message": "Memories consolidated"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,126 @@
+"""
+Semantic Response Cache
+Serves stored LLM answers for near-identical questions using embedding similarity
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Callable, Awaitable
+
+
+class SemanticCache:
+    """
+    In-process semantic cache for LLM responses.
+    Entries are partitioned by scope (e.g. user + agent + language) and matched
+    by cosine distance between prompt embeddings, so a re-asked question skips
+    the LLM call entirely.
+    A hit replays the stored answer word for word, so the default threshold
+    only matches near-identical questions (cosine similarity >= 0.97);
+    related ones such as "explain mitosis" / "explain meiosis" must miss.
+    """
+
+    def __init__(
+        self,
+        distance_threshold: float = 0.03,
+        ttl: int = 3600,
+        max_entries: int = 256,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        lookup_timeout: Optional[float] = None,
+    ):
+        self.distance_threshold = distance_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # A lookup that can't embed in time is treated as a miss
+        self.lookup_timeout = (
+            lookup_timeout if lookup_timeout is not None
+            else float(os.getenv("SEMANTIC_CACHE_TIMEOUT", "1.5"))
+        )
+        self._embed = embed
+        # (scope, prompt) -> (unit vector, response, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[float], str, float]]" = OrderedDict()
+        # Embeddings computed by a lookup, reused by the following update
+        self._pending: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """The cache needs the embedding API and can be switched off via SEMANTIC_CACHE=0."""
+        return os.getenv("SEMANTIC_CACHE", "1") != "0" and bool(os.getenv("GOOGLE_API_KEY"))
+
+    async def _vectorize(self, prompt: str) -> List[float]:
+        """Embed a prompt and normalize it to unit length."""
+        if prompt in self._pending:
+            return self._pending[prompt]
+
+        if self._embed is None:
+            # The standalone embedding module keeps pypdf and supabase out of this path
+            from .embedding import generate_embedding
+            self._embed = generate_embedding
+
+        vector = await self._embed(prompt)
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        vector = [v / norm for v in vector]
+
+        self._pending[prompt] = vector
+        if len(self._pending) > 64:
+            self._pending.popitem(last=False)
+        return vector
+
+    async def alookup(self, prompt: str, scope: str = "default") -> Optional[str]:
+        """Return a cached response for a semantically equivalent prompt, if any."""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        key = (scope, prompt)
+
+        # Exact repeats don't need an embedding round-trip
+        entry = self._entries.get(key)
+        if entry and entry[2] > now:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        try:
+            vector = await asyncio.wait_for(self._vectorize(prompt), self.lookup_timeout)
+        except asyncio.TimeoutError:
+            print("Semantic cache lookup timed out; treating as a miss")
+            return None
+        except Exception as e:
+            print(f"Semantic cache embedding error: {e}")
+            return None
+
+        best_key, best_distance = None, self.distance_threshold
+        for entry_key, (entry_vector, _, expires_at) in list(self._entries.items()):
+            if expires_at <= now:
+                del self._entries[entry_key]
+                continue
+            if entry_key[0] != scope:
+                continue
+            distance = 1.0 - sum(a * b for a, b in zip(vector, entry_vector))
+            if distance <= best_distance:
+                best_key, best_distance = entry_key, distance
+
+        if best_key is None:
+            return None
+
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][1]
+
+    async def aupdate(self, prompt: str, response: str, scope: str = "default"):
+        """Store a response for a prompt."""
+        if not self.enabled or not response:
+            return
+
+        try:
+            vector = await self._vectorize(prompt)
+        except Exception as e:
+            print(f"Semantic cache embedding error: {e}")
+            return
+
+        self._pending.pop(prompt, None)
+        self._entries[(scope, prompt)] = (vector, response, time.monotonic() + self.ttl)
+        self._entries.move_to_end((scope, prompt))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
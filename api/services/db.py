@@ -0,0 +1,11 @@
+"""
+Supabase Query Helper
+Shared by the memory and document services
+"""
+
+import asyncio
+
+
+async def execute(query):
+    """Run a Supabase query on a worker thread; the client is synchronous."""
+    return await asyncio.to_thread(query.execute)
@@ -4,14 +4,17 @@ Handles PDF ingestion, text extraction, chunking, and vector storage
 """
 
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, BinaryIO, Union
 from pypdf import PdfReader
 import io
-import httpx
+import asyncio
 
 # Supabase client
 from supabase import create_client, Client
 
+from .db import execute
+from .embedding import generate_embedding
+
 
 def get_supabase_client() -> Client:
     """Get Supabase client instance"""
@@ -24,17 +27,22 @@ def get_supabase_client() -> Client:
     return create_client(url, key)
 
 
-async def extract_text_from_pdf(content: bytes) -> str:
+async def extract_text_from_pdf(content: Union[bytes, BinaryIO]) -> str:
     """
     Extract text content from a PDF file.
     
     Args:
-        content: PDF file content as bytes
+        content: PDF file content as bytes, or a seekable binary file
     
     Returns:
         Extracted text as string
     """
-    pdf_file = io.BytesIO(content)
+    # pypdf is pure Python and CPU-bound; keep it off the event loop
+    return await asyncio.to_thread(_extract_pdf_pages, content)
+
+
+def _extract_pdf_pages(content: Union[bytes, BinaryIO]) -> str:
+    pdf_file = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
     reader = PdfReader(pdf_file)
     
     text_content = []
@@ -94,47 +102,51 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Di
     return chunks
 
 
-async def generate_embedding(text: str) -> List[float]:
-    """
-    Generate embedding vector using Google's embedding model.
-    
-    Args:
-        text: Text to embed
-    
-    Returns:
-        Embedding vector as list of floats
-    """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key={api_key}",
-            json={
-                "model": "models/text-embedding-004",
-                "content": {
-                    "parts": [{"text": text}]
-                }
-            }
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Embedding API error: {response.text}")
-        
-        data = response.json()
-        return data["embedding"]["values"]
-
-
-async def process_document(content: bytes, filename: str) -> Dict[str, Any]:
+async def process_document(
+    content: Union[bytes, BinaryIO],
+    filename: str,
+    sha256: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Process a PDF document: extract text, chunk, embed, and store.
     
     Args:
-        content: PDF file content
+        content: PDF file content, as bytes or a seekable binary file
         filename: Original filename
+        sha256: Hex digest of the file; an already-ingested file is skipped
     
     Returns:
         Processing result with chunk count and preview
     """
+    # Get Supabase client
+    supabase = get_supabase_client()
+    
+    # Skip re-parsing and re-embedding a file that is already fully indexed.
+    # Every chunk records how many chunks the file has, so an ingest that
+    # stopped partway is detected by its stored count falling short
+    if sha256:
+        existing = await execute(
+            supabase.table("documents")
+            .select("metadata", count="exact")
+            .eq("metadata->>sha256", sha256)
+            .limit(1)
+        )
+        if existing.data:
+            expected = existing.data[0]["metadata"].get("chunk_count")
+            if expected is not None and existing.count == int(expected):
+                return {
+                    "chunks_count": 0,
+                    "duplicate": True,
+                    "preview": "",
+                    "total_characters": 0,
+                }
+            # Incomplete earlier ingest: drop its chunks and start over
+            await execute(
+                supabase.table("documents")
+                .delete()
+                .eq("metadata->>sha256", sha256)
+            )
+    
     # Extract text
     text = await extract_text_from_pdf(content)
     
@@ -144,9 +156,6 @@ async def process_document(content: bytes, filename: str) -> Dict[str, Any]:
     # Chunk the text
     chunks = chunk_text(text)
     
-    # Get Supabase client
-    supabase = get_supabase_client()
-    
     # Process each chunk
     for chunk in chunks:
         # Generate embedding
@@ -154,13 +163,16 @@ async def process_document(content: bytes, filename: str) -> Dict[str, Any]:
         
         # Add filename to metadata
         chunk["metadata"]["filename"] = filename
+        if sha256:
+            chunk["metadata"]["sha256"] = sha256
+            chunk["metadata"]["chunk_count"] = len(chunks)
         
         # Store in Supabase
-        supabase.table("documents").insert({
+        await execute(supabase.table("documents").insert({
             "content": chunk["content"],
             "embedding": embedding,
             "metadata": chunk["metadata"],
-        }).execute()
+        }))
     
     return {
         "chunks_count": len(chunks),
@@ -191,13 +203,13 @@ async def search_documents(
     # Search in Supabase
     supabase = get_supabase_client()
     
-    response = supabase.rpc(
+    response = await execute(supabase.rpc(
         "match_documents",
         {
             "query_embedding": query_embedding,
             "match_threshold": match_threshold,
             "match_count": match_count,
         }
-    ).execute()
+    ))
     
     return response.data or []
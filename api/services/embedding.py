@@ -0,0 +1,59 @@
+"""
+Embedding Service
+Google text-embedding-004 vectors for document chunks, search queries and the semantic cache
+"""
+
+import os
+import asyncio
+from typing import List, Optional
+
+import httpx
+
+EMBEDDING_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent"
+
+# Pooled client so repeat embeddings reuse the warm TLS connection. Its
+# connections belong to the event loop that opened them, so it is rebuilt
+# when called from a different loop
+_client: Optional[httpx.AsyncClient] = None
+_client_loop = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client_loop = loop
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=30.0),
+        )
+    return _client
+
+
+async def generate_embedding(text: str) -> List[float]:
+    """
+    Generate embedding vector using Google's embedding model.
+    
+    Args:
+        text: Text to embed
+    
+    Returns:
+        Embedding vector as list of floats
+    """
+    api_key = os.getenv("GOOGLE_API_KEY")
+    
+    response = await _get_client().post(
+        f"{EMBEDDING_API_URL}?key={api_key}",
+        json={
+            "model": "models/text-embedding-004",
+            "content": {
+                "parts": [{"text": text}]
+            }
+        }
+    )
+    
+    if response.status_code != 200:
+        raise Exception(f"Embedding API error: {response.text}")
+    
+    data = response.json()
+    return data["embedding"]["values"]
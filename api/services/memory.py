@@ -8,22 +8,34 @@ Implements multiple memory types for context-aware tutoring:
 """
 
 import os
-import json
+import time
+import asyncio
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import hashlib
+import orjson
 
 # Supabase client
 from supabase import create_client, Client
 
+from .db import execute
+
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
 
 
+def _dumps(value: Any) -> str:
+    """Serialize a memory context to the JSON text stored in Supabase."""
+    return orjson.dumps(value).decode()
+
+
+@lru_cache(maxsize=1)
 def get_supabase() -> Client:
-    """Get Supabase client."""
+    """Get the process-wide Supabase client (shared by every memory store)."""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
@@ -98,7 +110,7 @@ class EpisodicMemory:
             "memory_type": MemoryType.EPISODIC.value,
             "session_id": session_id,
             "content": content,
-            "context": json.dumps(context),
+            "context": _dumps(context),
             "importance": importance.value,
             "recorded_at": datetime.utcnow().isoformat(),
             "last_accessed": datetime.utcnow().isoformat(),
@@ -107,7 +119,7 @@ class EpisodicMemory:
         }
         
         try:
-            self.supabase.table("memories").insert(memory_data).execute()
+            await execute(self.supabase.table("memories").insert(memory_data))
         except Exception as e:
             print(f"Error storing episodic memory: {e}")
         
@@ -128,19 +140,21 @@ class EpisodicMemory:
             cutoff = (datetime.utcnow() - timedelta(days=time_range_days)).isoformat()
             query_builder = query_builder.gte("recorded_at", cutoff)
         
-        result = query_builder.order("recorded_at", desc=True).limit(limit).execute()
+        result = await execute(query_builder.order("recorded_at", desc=True).limit(limit))
         
-        # Update access count for retrieved memories
-        for memory in result.data:
-            self._update_access(memory["id"])
+        # Update access count for retrieved memories (blocking calls, so off-loop)
+        if result.data:
+            await asyncio.to_thread(
+                lambda: [self._update_access(memory["id"]) for memory in result.data]
+            )
         
         return result.data
     
     async def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Get all memories from a specific session."""
-        result = self.supabase.table("memories").select("*").eq(
+        result = await execute(self.supabase.table("memories").select("*").eq(
             "user_id", self.user_id
-        ).eq("session_id", session_id).order("recorded_at", desc=False).execute()
+        ).eq("session_id", session_id).order("recorded_at", desc=False))
         
         return result.data
     
@@ -183,23 +197,23 @@ class SemanticMemory:
         ).hexdigest()[:16]
         
         # Check if similar fact exists and update instead
-        existing = self.supabase.table("memories").select("id").eq(
+        existing = await execute(self.supabase.table("memories").select("id").eq(
             "user_id", self.user_id
         ).eq("memory_type", MemoryType.SEMANTIC.value).ilike(
             "content", f"%{fact[:30]}%"
-        ).execute()
+        ))
         
         if existing.data:
             # Update existing fact with higher confidence
-            self.supabase.table("memories").update({
-                "context": json.dumps({
+            await execute(self.supabase.table("memories").update({
+                "context": _dumps({
                     "category": category,
                     "confidence": min(confidence + 0.1, 1.0),
                     "source_session": source_session,
                     "updated_at": datetime.utcnow().isoformat()
                 }),
                 "last_accessed": datetime.utcnow().isoformat(),
-            }).eq("id", existing.data[0]["id"]).execute()
+            }).eq("id", existing.data[0]["id"]))
             return existing.data[0]["id"]
         
         memory_data = {
@@ -207,7 +221,7 @@ class SemanticMemory:
             "user_id": self.user_id,
             "memory_type": MemoryType.SEMANTIC.value,
             "content": fact,
-            "context": json.dumps({
+            "context": _dumps({
                 "category": category,
                 "confidence": confidence,
                 "source_session": source_session
@@ -220,17 +234,111 @@ class SemanticMemory:
         }
         
         try:
-            self.supabase.table("memories").insert(memory_data).execute()
+            await execute(self.supabase.table("memories").insert(memory_data))
         except Exception as e:
             print(f"Error storing semantic memory: {e}")
         
         return memory_id
     
+    async def store_facts(
+        self,
+        facts: List[Dict[str, str]],
+        confidence: float = 0.8,
+        source_session: Optional[str] = None
+    ) -> List[str]:
+        """
+        Store several semantic facts in one pass.
+        Existing facts are matched with one query filtered on the facts'
+        prefixes, then refreshed with a single upsert while new ones go in a
+        single insert, instead of two round trips per fact.
+        """
+        facts = [f for f in facts if f.get("fact")]
+        if not facts:
+            return []
+        
+        needles = list(dict.fromkeys(f["fact"][:30].lower() for f in facts))
+        # PostgREST or-filter; values are quoted since facts can contain , and ()
+        prefix_filter = ",".join(
+            'content.ilike."*{}*"'.format(needle.replace("\\", "\\\\").replace('"', '\\"'))
+            for needle in needles
+        )
+        existing = await execute(self.supabase.table("memories").select("id, content").eq(
+            "user_id", self.user_id
+        ).eq("memory_type", MemoryType.SEMANTIC.value).or_(prefix_filter).limit(len(needles) * 5))
+        known = [(row["id"], row.get("content") or "") for row in existing.data or []]
+        
+        now = datetime.utcnow().isoformat()
+        memory_ids = []
+        updated_rows = {}
+        new_rows = {}
+        for item in facts:
+            category = item.get("category", "general")
+            fact = item["fact"]
+            needle = fact[:30].lower()
+            match = next(
+                ((memory_id, content) for memory_id, content in known if needle in content.lower()),
+                None,
+            )
+            
+            if match:
+                # Update existing fact with higher confidence
+                memory_id, content = match
+                if memory_id not in new_rows:
+                    updated_rows[memory_id] = {
+                        "id": memory_id,
+                        "user_id": self.user_id,
+                        "memory_type": MemoryType.SEMANTIC.value,
+                        "content": content,
+                        "context": _dumps({
+                            "category": category,
+                            "confidence": min(confidence + 0.1, 1.0),
+                            "source_session": source_session,
+                            "updated_at": now
+                        }),
+                        "last_accessed": now,
+                    }
+                memory_ids.append(memory_id)
+                continue
+            
+            memory_id = hashlib.sha256(
+                f"{self.user_id}:semantic:{category}:{fact[:50]}".encode()
+            ).hexdigest()[:16]
+            new_rows[memory_id] = {
+                "id": memory_id,
+                "user_id": self.user_id,
+                "memory_type": MemoryType.SEMANTIC.value,
+                "content": fact,
+                "context": _dumps({
+                    "category": category,
+                    "confidence": confidence,
+                    "source_session": source_session
+                }),
+                "importance": ImportanceLevel.HIGH.value,
+                "recorded_at": now,
+                "last_accessed": now,
+                "access_count": 0,
+                "decay_factor": 1.0,
+            }
+            known.append((memory_id, fact))
+            memory_ids.append(memory_id)
+        
+        # Both writes go out together; each row set is a single request
+        writes = []
+        if updated_rows:
+            writes.append(execute(self.supabase.table("memories").upsert(list(updated_rows.values()))))
+        if new_rows:
+            writes.append(execute(self.supabase.table("memories").insert(list(new_rows.values()))))
+        for result in await asyncio.gather(*writes, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error storing semantic memories: {result}")
+        
+        return memory_ids
+    
     async def get_user_profile(self) -> Dict[str, Any]:
         """Get comprehensive user profile from semantic memory."""
-        result = self.supabase.table("memories").select("*").eq(
+        result = await execute(self.supabase.table("memories").select("*").eq(
             "user_id", self.user_id
-        ).eq("memory_type", MemoryType.SEMANTIC.value).execute()
+        ).eq("memory_type", MemoryType.SEMANTIC.value))
         
         profile = {
             "learning_style": [],
@@ -242,7 +350,7 @@ class SemanticMemory:
         }
         
         for memory in result.data:
-            context = json.loads(memory.get("context", "{}"))
+            context = orjson.loads(memory.get("context", "{}"))
             category = context.get("category", "general")
             
             if category == "learning_style":
@@ -312,24 +420,24 @@ class ProceduralMemory:
         ).hexdigest()[:16]
         
         # Check for existing similar procedure
-        existing = self.supabase.table("memories").select("*").eq(
+        existing = await execute(self.supabase.table("memories").select("*").eq(
             "user_id", self.user_id
         ).eq("memory_type", MemoryType.PROCEDURAL.value).ilike(
             "content", f"%{description[:20]}%"
-        ).execute()
+        ))
         
         if existing.data:
             # Update success rate using exponential moving average
-            old_context = json.loads(existing.data[0].get("context", "{}"))
+            old_context = orjson.loads(existing.data[0].get("context", "{}"))
             old_rate = old_context.get("success_rate", 0.5)
             new_rate = 0.7 * success_rate + 0.3 * old_rate
             old_context["success_rate"] = new_rate
             old_context["use_count"] = old_context.get("use_count", 0) + 1
             
-            self.supabase.table("memories").update({
-                "context": json.dumps(old_context),
+            await execute(self.supabase.table("memories").update({
+                "context": _dumps(old_context),
                 "last_accessed": datetime.utcnow().isoformat(),
-            }).eq("id", existing.data[0]["id"]).execute()
+            }).eq("id", existing.data[0]["id"]))
             return existing.data[0]["id"]
         
         memory_data = {
@@ -337,7 +445,7 @@ class ProceduralMemory:
             "user_id": self.user_id,
             "memory_type": MemoryType.PROCEDURAL.value,
             "content": description,
-            "context": json.dumps({
+            "context": _dumps({
                 "procedure_type": procedure_type,
                 "success_rate": success_rate,
                 "use_count": 1,
@@ -351,7 +459,7 @@ class ProceduralMemory:
         }
         
         try:
-            self.supabase.table("memories").insert(memory_data).execute()
+            await execute(self.supabase.table("memories").insert(memory_data))
         except Exception as e:
             print(f"Error storing procedural memory: {e}")
         
@@ -367,11 +475,11 @@ class ProceduralMemory:
             "user_id", self.user_id
         ).eq("memory_type", MemoryType.PROCEDURAL.value)
         
-        result = query.execute()
+        result = await execute(query)
         
         strategies = []
         for memory in result.data:
-            context = json.loads(memory.get("context", "{}"))
+            context = orjson.loads(memory.get("context", "{}"))
             if context.get("success_rate", 0) >= min_success_rate:
                 if context_type is None or context.get("procedure_type") == context_type:
                     strategies.append({
@@ -437,7 +545,7 @@ class WorkingMemory:
             "memory_type": MemoryType.WORKING.value,
             "session_id": self.session_id,
             "content": key,
-            "context": json.dumps({"value": value, "ttl_minutes": ttl_minutes}),
+            "context": _dumps({"value": value, "ttl_minutes": ttl_minutes}),
             "importance": ImportanceLevel.LOW.value,
             "recorded_at": datetime.utcnow().isoformat(),
             "last_accessed": datetime.utcnow().isoformat(),
@@ -446,7 +554,7 @@ class WorkingMemory:
         }
         
         try:
-            self.supabase.table("memories").upsert(memory_data).execute()
+            await execute(self.supabase.table("memories").upsert(memory_data))
         except:
             pass
     
@@ -461,12 +569,12 @@ class WorkingMemory:
                 del self._cache[key]
         
         # Check database
-        result = self.supabase.table("memories").select("*").eq(
+        result = await execute(self.supabase.table("memories").select("*").eq(
             "id", f"wm:{self.session_id}:{key}"
-        ).execute()
+        ))
         
         if result.data:
-            context = json.loads(result.data[0].get("context", "{}"))
+            context = orjson.loads(result.data[0].get("context", "{}"))
             return context.get("value")
         
         return None
@@ -474,11 +582,11 @@ class WorkingMemory:
     async def get_conversation_summary(self) -> str:
         """Get a summary of the current conversation context."""
         # Get recent messages from this session
-        result = self.supabase.table("messages").select(
+        result = await execute(self.supabase.table("messages").select(
             "role, content"
         ).eq("session_id", self.session_id).order(
             "created_at", desc=True
-        ).limit(10).execute()
+        ).limit(10))
         
         if not result.data:
             return "No previous context in this conversation."
@@ -507,9 +615,9 @@ class WorkingMemory:
         """Clear all working memory for this session."""
         self._cache.clear()
         try:
-            self.supabase.table("memories").delete().eq(
+            await execute(self.supabase.table("memories").delete().eq(
                 "session_id", self.session_id
-            ).eq("memory_type", MemoryType.WORKING.value).execute()
+            ).eq("memory_type", MemoryType.WORKING.value))
         except:
             pass
 
@@ -557,7 +665,7 @@ class MemoryManager:
                 {
                     "content": ep["content"],
                     "recorded_at": ep["recorded_at"],
-                    "context": json.loads(ep.get("context", "{}"))
+                    "context": orjson.loads(ep.get("context", "{}"))
                 }
                 for ep in episodes
             ]
@@ -604,12 +712,7 @@ class MemoryManager:
         
         # Store any extracted facts to semantic memory
         if extracted_facts:
-            for fact in extracted_facts:
-                await self.semantic.store_fact(
-                    category=fact.get("category", "general"),
-                    fact=fact.get("fact", ""),
-                    source_session=self.session_id
-                )
+            await self.bulk_store_facts(extracted_facts)
         
         # If we know the interaction was helpful, record procedural memory
         if was_helpful is not None:
@@ -621,6 +724,10 @@ class MemoryManager:
                 was_successful=was_helpful
             )
     
+    async def bulk_store_facts(self, facts: List[Dict[str, str]]) -> List[str]:
+        """Store all facts extracted from a turn in one batched write."""
+        return await self.semantic.store_facts(facts, source_session=self.session_id)
+    
     def _detect_explanation_style(self, response: str) -> str:
         """Detect the explanation style used in a response."""
         styles = []
@@ -692,16 +799,54 @@ class MemoryManager:
         ]
 
 
+# Process-wide MemoryManager per (user_id, session_id), evicted least-recently-used
+# and dropped once idle for MANAGER_TTL_SECONDS
+_MAX_MANAGERS = 1024
+_MANAGER_TTL = float(os.getenv("MANAGER_TTL_SECONDS", "1800"))
+# (user_id, session_id) -> (manager, last access time)
+_managers: "OrderedDict[Tuple[str, str], Tuple[MemoryManager, float]]" = OrderedDict()
+
+
+def get_manager(user_id: str, session_id: str) -> MemoryManager:
+    """Get the cached MemoryManager for a session, creating it on first use."""
+    key = (user_id, session_id)
+    now = time.monotonic()
+    entry = _managers.get(key)
+    if entry is not None and now - entry[1] < _MANAGER_TTL:
+        # The TTL counts from the last access, so active sessions stay cached
+        _managers[key] = (entry[0], now)
+        _managers.move_to_end(key)
+        return entry[0]
+    
+    manager = MemoryManager(user_id, session_id)
+    _managers[key] = (manager, now)
+    _managers.move_to_end(key)
+    # Entries are ordered by last access, so expired sessions all sit at the
+    # cold end: drop them, then enforce the size bound
+    while _managers:
+        _, last_access = next(iter(_managers.values()))
+        if now - last_access < _MANAGER_TTL and len(_managers) <= _MAX_MANAGERS:
+            break
+        _managers.popitem(last=False)
+    return manager
+
+
 # Helper function for agents to use
 async def get_memory_context(user_id: str, session_id: str, query: str) -> str:
     """
     Get formatted memory context for use in agent prompts.
     Returns a string that can be directly included in the system prompt.
     """
-    manager = MemoryManager(user_id, session_id)
+    manager = get_manager(user_id, session_id)
     context = await manager.build_context_for_query(query)
-    
-    # Format as readable context
+    return format_memory_context(context)
+
+
+def format_memory_context(context: Dict[str, Any]) -> str:
+    """
+    Format a context dict from build_context_for_query for agent prompts.
+    Lets callers that already built the context skip a second round of queries.
+    """
     parts = []
     
     # User profile
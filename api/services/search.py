@@ -34,8 +34,7 @@ async def web_search(
             return results
     
     # Run in thread pool to avoid blocking
-    loop = asyncio.get_event_loop()
-    results = await loop.run_in_executor(None, _search)
+    results = await asyncio.to_thread(_search)
     
     # Format results
     formatted_results = []
@@ -71,8 +70,7 @@ async def image_search(
             ))
             return results
     
-    loop = asyncio.get_event_loop()
-    results = await loop.run_in_executor(None, _search)
+    results = await asyncio.to_thread(_search)
     
     formatted_results = []
     for result in results:
@@ -108,8 +106,7 @@ async def news_search(
             ))
             return results
     
-    loop = asyncio.get_event_loop()
-    results = await loop.run_in_executor(None, _search)
+    results = await asyncio.to_thread(_search)
     
     formatted_results = []
     for result in results:
@@ -5,7 +5,16 @@ Provides high-quality neural voice synthesis without API keys
 
 import edge_tts
 import asyncio
-from typing import AsyncGenerator
+import os
+from collections import OrderedDict
+from typing import AsyncGenerator, Tuple
+
+
+# Synthesized audio for short phrases (button labels, greetings), keyed by
+# (text, voice, rate) so repeated requests skip the Edge TTS round-trip
+_AUDIO_CACHE: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+_AUDIO_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "128"))
+_AUDIO_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", "200"))
 
 
 async def generate_speech(
@@ -24,11 +33,28 @@ async def generate_speech(
     Yields:
         Audio bytes in MP3 format
     """
+    key = (text, voice, rate)
+    cached = _AUDIO_CACHE.get(key)
+    if cached is not None:
+        _AUDIO_CACHE.move_to_end(key)
+        yield cached
+        return
+    
+    cacheable = len(text) <= _AUDIO_CACHE_MAX_CHARS and _AUDIO_CACHE_SIZE > 0
+    parts = []
     communicate = edge_tts.Communicate(text, voice, rate=rate)
     
     async for chunk in communicate.stream():
         if chunk["type"] == "audio":
+            if cacheable:
+                parts.append(chunk["data"])
             yield chunk["data"]
+    
+    # Only complete streams reach this point, so partial audio is never cached
+    if cacheable and parts:
+        _AUDIO_CACHE[key] = b"".join(parts)
+        while len(_AUDIO_CACHE) > _AUDIO_CACHE_SIZE:
+            _AUDIO_CACHE.popitem(last=False)
 
 
 async def get_available_voices() -> list:
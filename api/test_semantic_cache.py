@@ -0,0 +1,62 @@
+"""
+Test the semantic response cache's match threshold
+Related but different questions must not be answered with each other's
+cached response; near-identical rewordings should still hit.
+
+Runs offline with a fixed embedding table: python test_semantic_cache.py
+"""
+
+import asyncio
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("GOOGLE_API_KEY", "test")  # The cache is off without it
+os.environ["SEMANTIC_CACHE"] = "1"
+
+from services.cache import SemanticCache
+
+
+def _at_similarity(similarity: float):
+    """Unit vector whose cosine similarity with [1, 0] is `similarity`."""
+    return [similarity, math.sqrt(1 - similarity * similarity)]
+
+
+EMBEDDINGS = {
+    "explain mitosis": [1.0, 0.0],
+    "explain mitosis?": _at_similarity(0.99),   # Same question, punctuation differs
+    "explain meiosis": _at_similarity(0.9),     # Related, but a different question
+    "what is mitosis": _at_similarity(0.95),
+}
+
+
+async def _embed(prompt: str):
+    return EMBEDDINGS[prompt]
+
+
+async def _run():
+    cache = SemanticCache(embed=_embed)
+    await cache.aupdate("explain mitosis", "Mitosis answer", scope="user:tutor:en")
+    
+    near_misses = {
+        prompt: await cache.alookup(prompt, scope="user:tutor:en")
+        for prompt in ("explain meiosis", "what is mitosis")
+    }
+    repeat = await cache.alookup("explain mitosis?", scope="user:tutor:en")
+    other_scope = await cache.alookup("explain mitosis?", scope="user:feynman:en")
+    return near_misses, repeat, other_scope
+
+
+def test_semantic_cache():
+    near_misses, repeat, other_scope = asyncio.run(_run())
+    
+    for prompt, cached in near_misses.items():
+        assert cached is None, f"{prompt!r} was served another question's answer"
+    assert repeat == "Mitosis answer"
+    assert other_scope is None
+    print("✅ Semantic cache threshold OK")
+
+
+if __name__ == "__main__":
+    test_semantic_cache()
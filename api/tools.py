@@ -8,6 +8,17 @@ from langchain_core.tools import tool
 from .services.search import web_search, format_search_results_for_context
 from .services.document import search_documents
 import urllib.parse
+from functools import lru_cache
+
+
+_IMG_BASE = "https://image.pollinations.ai/prompt/"
+
+
+@lru_cache(maxsize=2048)
+def _visual_markdown(concept: str, style: str) -> str:
+    """Build the Pollinations.ai image link for a concept (deterministic, so cached)."""
+    prompt = f"{concept}, {style}, clean, labeled, educational, simple, white background"
+    return f"![{concept}]({_IMG_BASE}{urllib.parse.quote(prompt)}?width=512&height=512)"
 
 
 @tool
@@ -72,13 +83,7 @@ def generate_visual(concept: str, style: str = "educational diagram") -> str:
     Returns:
         Markdown image link to the generated visual
     """
-    # Create a detailed prompt for Pollinations.ai
-    prompt = f"{concept}, {style}, clean, labeled, educational, simple, white background"
-    encoded_prompt = urllib.parse.quote(prompt)
-    
-    url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=512&height=512"
-    
-    return f"![{concept}]({url})"
+    return _visual_markdown(concept, style)
 
 
 @tool
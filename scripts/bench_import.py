@@ -0,0 +1,56 @@
+"""
+Import-time audit for the API entrypoint
+Runs `python -X importtime` on api/index.py and lists the slowest imports,
+so decisions about what to load lazily are based on measurements
+
+Usage: python scripts/bench_import.py [--top 20] [--module index]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+
+def measure(module: str):
+    """Import `module` in a fresh interpreter and return (self_us, cumulative_us, name) rows."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        # The importtime log is on stderr too; show only the actual error
+        error_lines = [l for l in result.stderr.splitlines() if not l.startswith("import time:")]
+        raise SystemExit(f"Importing {module} failed:\n" + "\n".join(error_lines[-20:]))
+
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=20, help="number of imports to list")
+    parser.add_argument("--module", default="index", help="module to import from api/")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_us = sum(self_us for self_us, _, _ in rows)
+
+    print(f"{args.module}: {len(rows)} modules, {total_us / 1000:.1f} ms total import time\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Self-hosted API server (Docker / VM deployments; Vercel runs api/index.py itself)
+Serves the FastAPI app with uvloop + httptools and one worker per CPU,
+or WEB_CONCURRENCY workers when set
+
+Install: pip install -r scripts/requirements-serve.txt
+Usage: python scripts/serve.py   (HOST, PORT and WEB_CONCURRENCY are read from the environment)
+"""
+
+import os
+
+import uvicorn
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+
+def _has(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def main():
+    workers = int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+    # Each worker is a separate process with its own caches and model-call limit
+    uvicorn.run(
+        "index:app",
+        app_dir=API_DIR,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        loop="uvloop" if _has("uvloop") else "asyncio",
+        http="httptools" if _has("httptools") else "h11",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -215,11 +215,16 @@ export function ChatInterface({ sessionId, onOpenWorkspace }: ChatInterfaceProps
               }
               
               // Handle completion with tool info
-              if (data.done && data.tool_used) {
-                const store = useAppStore.getState();
-                store.updateMessage(sessionId, assistantMessageId, {
-                  metadata: { ...store.messages[sessionId]?.find(m => m.id === assistantMessageId)?.metadata, toolUsed: data.tool_used },
-                });
+              if (data.done) {
+                if (data.tool_used) {
+                  const store = useAppStore.getState();
+                  store.updateMessage(sessionId, assistantMessageId, {
+                    metadata: { ...store.messages[sessionId]?.find(m => m.id === assistantMessageId)?.metadata, toolUsed: data.tool_used },
+                  });
+                }
+                // The answer is complete; the server may still be saving it
+                // to memory before closing the stream, so unlock input now
+                setIsLoading(false);
               }
             } catch (e) {
               // Skip non-JSON lines